@@ -1,9 +1,22 @@
 from .chat_manager import ChatManager
 from .generate_reply import generate_reply
 from .generate_response import generate_response
+from .fused_response import generate_fused_response
+from .context_budget import ContextBudget
+from .summarizer import summarize_text, merge_instructions
+from .answer_extractor import extract_answers
+from .state_cache import CachedQuestionList, CachedUserAnswerStorage, CachedContext
 
 __all__ = [
     "ChatManager",
     "generate_reply",
     "generate_response",
+    "generate_fused_response",
+    "ContextBudget",
+    "summarize_text",
+    "merge_instructions",
+    "extract_answers",
+    "CachedQuestionList",
+    "CachedUserAnswerStorage",
+    "CachedContext",
 ]
@@ -0,0 +1,108 @@
+from typing import Optional
+import logging
+
+from pydantic import BaseModel, Field
+
+from src import types
+
+from .simple_agent import SimpleAgent
+from .validator import INSTRUCTIONS as VALIDATOR_INSTRUCTIONS
+
+
+INSTRUCTIONS = f"""
+You check which questions of an onboarding questionnaire are already answered
+by the conversation so far. Users often answer several questions in one message.
+
+For every question in the list decide if its answer requirement is fully met
+by the whole conversation context. Use the same rules as the validator agent below.
+Mark a question as answered only if the requirement is met completely;
+partial answers and guesses are not answered.
+
+{VALIDATOR_INSTRUCTIONS}
+"""
+
+
+class QuestionAnswer(BaseModel):
+    question_number: int = Field(..., description="Number of the question in the list.")
+    is_answered: bool = Field(
+        ..., description="True only if the answer requirement is fully met."
+    )
+    extracted_user_answer: Optional[str] = Field(
+        None,
+        description=(
+            "Consice and concrete user's answer "
+            "to the question starting with 'User responded that...'. "
+            "Null if the question is not answered."
+        ),
+    )
+
+
+class ExtractedAnswers(BaseModel):
+    answers: list[QuestionAnswer] = Field(
+        ..., description="One entry per question, in the order of the list."
+    )
+
+
+logger = logging.getLogger(__name__)
+
+
+def expand_query(
+    context: str | None,
+    questions: list[types.Question],
+    instructions: str | None = None,
+) -> str:
+    listed = "\n\n".join(
+        f'{number}. Question: "{q.text}"\n**Requirement:**\n"{q.answer_requirement}"'
+        for number, q in enumerate(questions, start=1)
+    )
+    query = f"""
+**Context of conversation (messages that were in the chat earlier):**
+{context}
+
+**Questions:**
+{listed}
+"""
+    if instructions:
+        query = f"**Strictly follow these instructions before validating**:\n{instructions}\n\n{query}"
+    return query
+
+
+answer_extractor = SimpleAgent(
+    name="answer_extractor",
+    instructions=INSTRUCTIONS,
+    expand_query=expand_query,
+    output_type=ExtractedAnswers,
+    deadline=60,
+)
+
+
+async def extract_answers(
+    context: str | None,
+    questions: list[types.Question],
+    instructions: str | None = None,
+) -> list[str | None]:
+    """
+    Checks the conversation against several questions in one model call.
+
+    :param context: conversation so far
+    :param questions: questions to check, in order
+    :param instructions: additional instructions learned from managers
+    :return: extracted answer for each question (None if it is not answered)
+    """
+    if not questions:
+        return []
+
+    result = await answer_extractor(
+        context, questions=questions, instructions=instructions
+    )
+    logger.info(f"extract_answers: {result!r}")
+
+    answers: list[str | None] = [None] * len(questions)
+    for a in result.answers:
+        if (
+            a.is_answered
+            and a.extracted_user_answer
+            and 1 <= a.question_number <= len(questions)
+        ):
+            answers[a.question_number - 1] = a.extracted_user_answer
+    return answers
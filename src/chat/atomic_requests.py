@@ -57,6 +57,11 @@ Return a list of atomic requests, each as a separate string.
 
 
 atomic_separator = SimpleAgent(
+    name="atomic_separator",
     instructions=INSTRUCTIONS,
     output_type=UserRequests,
+    cache=True,
+    deadline=30,
+    hedge=True,
+    coalesce=True,
 )
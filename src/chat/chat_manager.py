@@ -1,10 +1,23 @@
 import logging
-from typing import Callable, Iterable
+import time
+from typing import Awaitable, Callable, Iterable
 
 from src import types
+from src.utils import db_queries
+from src.utils.metrics import metrics
 
+from . import unit_of_work, usage
 from .chat_state_manager import ChatStateManager
+from .context_budget import (
+    ContextBudget,
+    ContextCompactor,
+    estimate_tokens,
+    format_turn,
+)
+from .info_extractor import update_info
+from .user_info import UserInfoTracker
 from .generate_response import ResponseToUser
+from .state_cache import CachedQuestionList, CachedUserAnswerStorage
 
 type ResponseGenerator = Callable[[str, types.State], ResponseToUser]
 """
@@ -22,6 +35,25 @@ This callable takes a `ResponeToUser` to enrich the context and current chat sta
 Based on them, it returns a natural reply.
 """
 
+type AnswerExtractor = Callable[
+    [str | None, list[types.Question], str | None], Awaitable[list[str | None]]
+]
+"""
+Callable which checks the conversation against several questions at once.
+Takes conversation context, questions and instructions.
+Returns an extracted answer per question (None for unanswered ones).
+"""
+
+type ContextSummarizer = Callable[[str], Awaitable[str]]
+"""
+Callable which condenses older conversation turns into a short summary.
+"""
+
+type InstructionsMerger = Callable[[str], Awaitable[str]]
+"""
+Callable which merges accumulated learned instructions into one deduplicated block.
+"""
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,6 +70,14 @@ class ChatManager:
         generate_response: ResponseGenerator,
         generate_reply: ReplyGenerator,
         on_all_finished: Iterable[types.QaProcessor] | None = None,
+        response_generators: dict[str, ResponseGenerator] | None = None,
+        context_budget: ContextBudget | None = None,
+        summarize_context: ContextSummarizer | None = None,
+        extract_answers: AnswerExtractor | None = None,
+        user_info_storage: types.UserInfoStorage | None = None,
+        transaction: unit_of_work.TransactionFactory | None = None,
+        merge_instructions: InstructionsMerger | None = None,
+        instructions_max_tokens: int | None = None,
     ) -> None:
         """
         Initialize ChatManager with question sequence, persistence layer, and response generators.
@@ -55,16 +95,86 @@ class ChatManager:
                 by enriching responses with context like next questions.
             on_all_finished (Iterable[OnAllFinishedCallback]): A list of callback functions
                 to be executed when a user finishes all questions.
+            response_generators (dict[str, ResponseGenerator]): Named alternatives to
+                `generate_response` which can be selected at runtime.
+            context_budget (ContextBudget): Limits of the conversation context
+                passed to agents. Older turns are summarized with `summarize_context`
+                once the limit is exceeded. Context is unbounded if either is None.
+            summarize_context (ContextSummarizer): A callable that condenses
+                older conversation turns.
+            extract_answers (AnswerExtractor): A callable used after a question is
+                answered to finish all following questions the user has already
+                answered, in one pass. If None, the response pipeline is rerun
+                for every following question instead.
+            user_info_storage (UserInfoStorage): A storage for information extracted
+                from the answers. If given, the information is updated in the background
+                after every answered question, so processors do not have to extract it.
+            transaction (TransactionFactory): A callable opening a database transaction.
+                If given, all state writes of a reply are committed at once and
+                `on_all_finished` callbacks run after the commit.
+            merge_instructions (InstructionsMerger): A callable used by
+                `compact_instructions`. Instructions cannot be compacted if None.
+            instructions_max_tokens (int): Size of learned instructions after which
+                they are compacted automatically by `learn` (only on demand if None).
         """
         self.generate_response = generate_response
+        self.response_generator_name = "default"
+        self.response_generators = dict(response_generators or {})
         self.generate_reply = generate_reply
+        self.extract_answers = extract_answers
+        self.transaction = transaction
+        self.merge_instructions = merge_instructions
+        self.instructions_max_tokens = instructions_max_tokens
         self.context = context
+        # Users whose running reply has started storing the turn
+        self._committing: set[int] = set()
+        context_compactor = None
+        if context_budget is not None and summarize_context is not None:
+            context_compactor = ContextCompactor(
+                user_answer_storage=user_answer_storage,
+                summarize=summarize_context,
+                budget=context_budget,
+            )
         self.chat_state_manager = ChatStateManager(
             question_list=question_list,
             user_answer_storage=user_answer_storage,
             on_all_finished=on_all_finished,
+            context_compactor=context_compactor,
+            user_info_tracker=UserInfoTracker(user_info_storage, update_info)
+            if user_info_storage is not None
+            else None,
         )
 
+    def select_response_generator(self, name: str) -> None:
+        """
+        Switch to another registered response generator, e.g. to compare
+        latency and token cost of different pipelines on the same traffic.
+
+        Args:
+            name (str): Name of the generator in `response_generators`.
+
+        Raises:
+            KeyError: If no generator is registered under that name.
+        """
+        self.generate_response = self.response_generators[name]
+        self.response_generator_name = name
+        logger.info(f"Switched response generator to {name!r}")
+
+    def invalidate_cached_state(self, user_id: int) -> None:
+        """
+        Drop the user's progress cached by this process, e.g. after
+        another process has replied to them.
+
+        Args:
+            user_id (int): Unique identifier for the user session.
+        """
+        for storage in (
+            self.chat_state_manager.question_list,
+            self.chat_state_manager.user_answer_storage,
+        ):
+            if isinstance(storage, (CachedQuestionList, CachedUserAnswerStorage)):
+                storage.invalidate(user_id)
+
     async def has_user_started(self, user_id: int) -> bool:
         return await self.chat_state_manager.has_user_started(user_id)
 
@@ -104,7 +214,27 @@ class ChatManager:
     async def stop_talking_with(self, user_id: int) -> None:
         await self.chat_state_manager.stop_talking_with(user_id)
 
-    async def reply(self, user_id: int, user_input: str) -> str | None:
+    def reply_cancellable(self, user_id: int) -> bool:
+        """
+        Check whether a running `reply` to the user can be cancelled, e.g. to
+        start over with a newer message, without losing anything.
+        Replies are cancellable until they start storing the turn: agent calls
+        are cancelled down to the pending HTTP requests, and nothing is written.
+
+        Args:
+            user_id (int): Unique identifier for the user session.
+
+        Returns:
+            bool: False once the reply has started committing state.
+        """
+        return user_id not in self._committing
+
+    async def reply(
+        self,
+        user_id: int,
+        user_input: str,
+        consume_input: Callable[[], Awaitable[None]] | None = None,
+    ) -> str | None:
         """
         Process a single user message, advance the Q&A state, and generate
         the next bot reply combining the agent's text and the following question.
@@ -119,6 +249,9 @@ class ChatManager:
         Args:
             user_id (int): Unique identifier for the user session.
             user_input (str): The latest message from the user.
+            consume_input (Callable | None): Runs in the transaction which stores
+                the turn, e.g. to remove the input from a queue, so the input is
+                never both stored and left to be answered again.
 
         Returns:
             The text the bot should reply with, including the next
@@ -130,12 +263,43 @@ class ChatManager:
         ) and await self.chat_state_manager.all_finished(user_id):
             return None
 
+        # Agent calls (including processors) are accounted to this user
+        with usage.tagged(user_id), db_queries.counting() as queries:
+            try:
+                reply = await self._reply(user_id, user_input, consume_input)
+            finally:
+                self._committing.discard(user_id)
+        metrics.observe("chat.db_queries_per_reply", queries.value)
+        return reply
+
+    async def _reply(
+        self,
+        user_id: int,
+        user_input: str,
+        consume_input: Callable[[], Awaitable[None]] | None,
+    ) -> str | None:
         # Invoke the dialog agent and update state
         agent_response = await self._talk(user_id, user_input)
         if not agent_response:
             return None
 
-        await self._update_state(user_id, agent_response)
+        following_answers = []
+        if agent_response.ready_for_next_question and self.extract_answers is not None:
+            following_answers = await self._extract_following_answers(
+                user_id, agent_response
+            )
+
+        # Agents are done, so all writes of the turn are committed at once.
+        # From here on the input is stored and must not be sent again
+        self._committing.add(user_id)
+        async with unit_of_work.unit_of_work(self.transaction):
+            await self._update_state(user_id, agent_response)
+            for answer in following_answers:
+                if answer is None:
+                    break
+                await self.chat_state_manager.finish_question(user_id, answer)
+            if consume_input is not None:
+                await consume_input()
 
         if await self.chat_state_manager.all_finished(user_id):
             return agent_response.response_text
@@ -143,6 +307,9 @@ class ChatManager:
         if not agent_response.ready_for_next_question:
             return agent_response.response_text
 
+        if self.extract_answers is not None:
+            return await self.current_question(user_id)
+
         while (
             not (await self.chat_state_manager.all_finished(user_id))
             and agent_response.ready_for_next_question
@@ -152,7 +319,8 @@ class ChatManager:
                 reply_text = await self.current_question(user_id)
                 break
 
-            await self._update_state(user_id, agent_response)
+            async with unit_of_work.unit_of_work(self.transaction):
+                await self._update_state(user_id, agent_response)
 
             if await self.chat_state_manager.all_finished(user_id):
                 return agent_response.response_text
@@ -176,15 +344,52 @@ class ChatManager:
         _, question, context = await self.chat_state_manager.current_state(user_id)
         logger.info(f"_talk: Context:\n{context!r}")
         instructions = await self.context.get()
-        answer = await self.generate_response(
-            user_input=user_input,
-            question=question,
-            context=context,
-            instructions=instructions,
+        question_index = await self.chat_state_manager.current_question_index(user_id)
+        started_at = time.perf_counter()
+        with usage.tagged(user_id, question_index):
+            answer = await self.generate_response(
+                user_input=user_input,
+                question=question,
+                context=context,
+                instructions=instructions,
+            )
+        metrics.observe(
+            f"pipeline.{self.response_generator_name}.latency_s",
+            time.perf_counter() - started_at,
         )
         logger.info(f"_talk: AgentResponse:\n{answer!r}")
         return answer
 
+    async def _extract_following_answers(
+        self, user_id: int, agent_response: ResponseToUser
+    ) -> list[str | None]:
+        """
+        Check which questions after the current one are already answered
+        in the conversation, including the turn which is not stored yet.
+
+        Args:
+            user_id (int): Identifier of the user session.
+            agent_response (ResponseToUser): The response which answered
+                the current question.
+
+        Returns:
+            list[str | None]: Extracted answer for each following question
+                (None for unanswered ones).
+        """
+        remaining = await self.chat_state_manager.remaining_questions(user_id)
+        following = remaining[1:]
+        if not following:
+            return []
+
+        _, question, context = await self.chat_state_manager.current_state(user_id)
+        context = (context or "") + format_turn(
+            question.text, agent_response.user_input, agent_response.response_text
+        )
+        instructions = await self.context.get()
+        answers = await self.extract_answers(context, following, instructions)
+        logger.info(f"_extract_following_answers: answers:\n{answers!r}")
+        return answers
+
     async def _update_state(self, user_id: int, agent_responce: ResponseToUser) -> None:
         """
         Update the ChatStateManager based on whether the agent has indicated
@@ -226,3 +431,46 @@ You last answer did not follow them, do not repeat the same mistakes:
 '{incorrect_example}'
 """
         await self.context.append(instructions_text)
+
+        if self.merge_instructions is None or not self.instructions_max_tokens:
+            return
+        instructions = await self.context.get()
+        if estimate_tokens(instructions or "") > self.instructions_max_tokens:
+            try:
+                await self.compact_instructions()
+            except Exception as e:
+                # Instructions are learned anyway, they are just not compacted yet
+                logger.error(f"Failed to compact instructions: {e}")
+
+    async def compact_instructions(self) -> bool:
+        """
+        Merge all learned instructions into one deduplicated block,
+        so the instructions passed to agents on every turn stop growing.
+
+        Returns:
+            bool: Whether the instructions were replaced. They are kept if
+                there is nothing to compact or they were changed meanwhile.
+
+        Raises:
+            RuntimeError: If no `merge_instructions` callable is configured.
+        """
+        if self.merge_instructions is None:
+            raise RuntimeError("Instructions compaction is not configured")
+
+        instructions = await self.context.get()
+        if not instructions:
+            return False
+
+        merged = await self.merge_instructions(instructions)
+
+        # Instructions learned or forgotten while merging must not be lost
+        if await self.context.get() != instructions:
+            metrics.increment("instructions.compactions_discarded")
+            return False
+
+        await self.context.replace(merged)
+        metrics.increment("instructions.compactions")
+        logger.info(
+            f"Compacted instructions: {len(instructions)} -> {len(merged)} chars"
+        )
+        return True
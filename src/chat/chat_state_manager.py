@@ -2,6 +2,10 @@ from typing import Iterable
 
 from src import types
 
+from . import llm_scheduler, unit_of_work
+from .context_budget import ContextCompactor, format_turn
+from .user_info import UserInfoTracker
+
 
 class ChatStateManager:
     """
@@ -13,15 +17,21 @@ class ChatStateManager:
         question_list: types.QuestionList,
         user_answer_storage: types.UserAnswerStorage,
         on_all_finished: Iterable[types.QaProcessor] | None = None,
+        context_compactor: ContextCompactor | None = None,
+        user_info_tracker: UserInfoTracker | None = None,
     ) -> None:
         """
         :param question_list: Source of questions and navigation controls
         :param user_answer_storage: Storage for accumulating each user’s in-progress answer
         :param on_all_finished: Iterable of callbacks to be executed when a user finishes all questions
+        :param context_compactor: Keeps the stored conversation within a token budget (unbounded if None)
+        :param user_info_tracker: Extracts user information as questions are answered
         """
         self.question_list = question_list
         self.user_answer_storage = user_answer_storage
         self.on_all_finished_callbacks = on_all_finished or ()
+        self.context_compactor = context_compactor
+        self.user_info_tracker = user_info_tracker
 
     async def has_user_started(self, user_id: int) -> bool:
         """
@@ -46,6 +56,20 @@ class ChatStateManager:
         partial_answer = await self.user_answer_storage.get(user_id)
         return types.State(types.StateType.IN_PROGRESS, question, partial_answer)
 
+    async def current_question_index(self, user_id: int) -> int | None:
+        """
+        :param user_id: identifier for the conversation participant
+        :return: index of the active question (None if all questions are answered)
+        """
+        return await self.question_list.current_question_index(user_id)
+
+    async def remaining_questions(self, user_id: int) -> list[types.Question]:
+        """
+        :param user_id: identifier for the conversation participant
+        :return: the active question followed by all questions after it
+        """
+        return await self.question_list.remaining_questions(user_id)
+
     async def remember(
         self,
         user_id: int,
@@ -53,14 +77,17 @@ class ChatStateManager:
         user_input: str,
         response_text: str,
     ) -> None:
-        context = f"""
-Question: '{question}'
-User responded: '{user_input}'
-Response to user: '{response_text}'
+        context = format_turn(question, user_input, response_text)
+        await self.user_answer_storage.append(user_id, context)
 
+        if self.context_compactor is not None:
 
-"""
-        await self.user_answer_storage.append(user_id, context)
+            async def compact() -> None:
+                self.context_compactor.maybe_compact(
+                    user_id, await self.user_answer_storage.get(user_id)
+                )
+
+            await unit_of_work.after_commit(compact)
 
     async def finish_question(self, user_id: int, answer: str) -> None:
         """
@@ -69,13 +96,34 @@ Response to user: '{response_text}'
 
         :param user_id: identifier for the conversation participant
         """
+        question = None
+        if self.user_info_tracker is not None:
+            question = await self.question_list.current_question(user_id)
+
         await self.question_list.advance(user_id, answer)
 
+        if question is not None:
+
+            async def track() -> None:
+                self.user_info_tracker.track(user_id, question.text, answer)
+
+            await unit_of_work.after_commit(track)
+
         # TODO: Возможно, стоит делать это в отдельном методе...
         if await self.all_finished(user_id):
+            await self.stop_talking_with(user_id)
+            # Processors talk to agents and external services,
+            # so they must not hold the transaction open
+            await unit_of_work.after_commit(lambda: self._run_processors(user_id))
+
+    async def _run_processors(self, user_id: int) -> None:
+        if self.user_info_tracker is not None:
+            # Processors read the extracted information, it must be complete
+            await self.user_info_tracker.wait(user_id)
+        # Processors are not part of the reply, so they yield to live users
+        with llm_scheduler.priority(llm_scheduler.Priority.BACKGROUND):
             for callback in self.on_all_finished_callbacks:
                 await callback(user_id, await self.question_list.qa_pairs(user_id))
-            await self.stop_talking_with(user_id)
 
     async def all_finished(self, user_id: int) -> bool:
         """
@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+import os
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+
+@dataclass(frozen=True, slots=True)
+class ClientPoolSettings:
+    """
+    Connection settings shared by every pooled OpenAI client.
+    """
+
+    max_connections: int = 100
+    """
+    Upper bound of simultaneously open connections per client.
+    """
+
+    max_keepalive_connections: int = 20
+    """
+    How many idle connections are kept warm between calls.
+    """
+
+    keepalive_expiry: float = 60.0
+    """
+    Seconds an idle connection may stay in the pool before it is closed.
+    """
+
+    timeout: float = 60.0
+    """
+    Default request timeout in seconds (agents may override it per call).
+    """
+
+
+_settings = ClientPoolSettings()
+
+# (api_key, base_url) → long-lived client with its own connection pool
+_clients: dict[tuple[str | None, str | None], AsyncOpenAI] = {}
+
+
+def configure(settings: ClientPoolSettings) -> None:
+    """
+    Sets pool settings for clients created from now on.
+    Should be called once at startup, before the first agent call.
+
+    :param settings: connection pool settings
+    """
+    global _settings
+    _settings = settings
+
+
+def get_client(api_key: str | None = None, base_url: str | None = None) -> AsyncOpenAI:
+    """
+    Returns a process-wide client for the given credentials, creating it on first use.
+
+    :param api_key: OpenAI API key (defaults to environment variable if unset)
+    :param base_url: OpenAI API endpoint URL (defaults to environment variable if unset)
+    :return: a shared AsyncOpenAI client which reuses warm connections
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    base_url = base_url or os.getenv("OPENAI_API_BASE_URL")
+
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed():
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=_settings.timeout,
+            # Retries are done by agents, which know their own deadlines
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                timeout=_settings.timeout,
+                limits=httpx.Limits(
+                    max_connections=_settings.max_connections,
+                    max_keepalive_connections=_settings.max_keepalive_connections,
+                    keepalive_expiry=_settings.keepalive_expiry,
+                ),
+            ),
+        )
+        _clients[key] = client
+    return client
+
+
+async def close_all() -> None:
+    """
+    Closes every pooled client and its connections. Called on bot shutdown.
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
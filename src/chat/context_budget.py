@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+from src import types
+from src.utils.metrics import metrics
+
+from . import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+TURN_TEMPLATE = """
+Question: '{question}'
+User responded: '{user_input}'
+Response to user: '{response_text}'
+
+
+"""
+
+SUMMARY_TEMPLATE = """
+Summary of the earlier conversation: '{summary}'
+
+
+"""
+
+
+def format_turn(question: str, user_input: str, response_text: str) -> str:
+    return TURN_TEMPLATE.format(
+        question=question,
+        user_input=user_input,
+        response_text=response_text,
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token, which is enough for a budget
+    return len(text) // 4
+
+
+@dataclass(frozen=True, slots=True)
+class ContextBudget:
+    """
+    Bounds the conversation context passed to agents.
+    """
+
+    max_tokens: int = 3000
+    """
+    Context size which triggers compaction.
+    """
+
+    keep_turns: int = 3
+    """
+    How many of the latest turns are always kept verbatim.
+    """
+
+
+class ContextCompactor:
+    """
+    Keeps the stored conversation context of each user within a `ContextBudget`
+    by summarizing older turns in the background.
+    """
+
+    def __init__(
+        self,
+        user_answer_storage: types.UserAnswerStorage,
+        summarize: Callable[[str], Awaitable[str]],
+        budget: ContextBudget,
+    ) -> None:
+        """
+        :param user_answer_storage: storage of the conversation context
+        :param summarize: callable which condenses a text
+        :param budget: limits of the context size
+        """
+        self.user_answer_storage = user_answer_storage
+        self.summarize = summarize
+        self.budget = budget
+        # user_id → running compaction, at most one per user
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def maybe_compact(self, user_id: int, context: str | None) -> None:
+        """
+        Starts compaction of the user's context if it exceeds the budget.
+        Returns immediately; the reply never waits for the summary.
+
+        :param user_id: identifier for the conversation participant
+        :param context: currently stored context
+        """
+        if context is None or estimate_tokens(context) <= self.budget.max_tokens:
+            return
+        if user_id in self._tasks:
+            return
+
+        task = asyncio.create_task(self._compact(user_id))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def _compact(self, user_id: int) -> None:
+        # Every remembered turn is a segment, an earlier summary is the first one
+        segments = await self.user_answer_storage.segments(user_id)
+        # Not `[: -keep_turns]`, which keeps everything with keep_turns=0
+        old = segments[: len(segments) - self.budget.keep_turns]
+        if not old:
+            return
+        old_text = "".join(text for _, text in old)
+
+        try:
+            with llm_scheduler.priority(llm_scheduler.Priority.BACKGROUND):
+                summary = await self.summarize(old_text)
+        except Exception as e:
+            logger.error(f"Failed to summarize context of user {user_id}: {e}")
+            return
+
+        # Only the summarized segments are replaced, turns appended meanwhile
+        # are kept; if the context was cleared or replaced, the summary is outdated
+        summary_text = SUMMARY_TEMPLATE.format(summary=summary)
+        if not await self.user_answer_storage.replace_up_to(
+            user_id, old[-1][0], summary_text
+        ):
+            metrics.increment("context_budget.discarded")
+            return
+
+        metrics.increment("context_budget.compactions")
+        metrics.observe(
+            "context_budget.saved_tokens",
+            estimate_tokens(old_text) - estimate_tokens(summary_text),
+        )
+        logger.info(
+            f"Compacted context of user {user_id}: "
+            f"{len(old)} turns, {len(old_text)} -> {len(summary_text)} chars"
+        )
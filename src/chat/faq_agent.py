@@ -172,6 +172,9 @@ Reply to the following user request: '{user_input}'"
 
 
 faq_agent = SimpleAgent(
+    name="faq_agent",
     instructions=INSTRUCTIONS,
     expand_query=expand_query,
+    cache=True,
+    deadline=45,
 )
@@ -0,0 +1,136 @@
+from typing import Optional
+import logging
+
+from pydantic import BaseModel, Field
+
+from src import types
+
+from .simple_agent import SimpleAgent
+from .atomic_requests import INSTRUCTIONS as SEPARATOR_INSTRUCTIONS
+from .router import INSTRUCTIONS as ROUTER_INSTRUCTIONS, Intent
+from .validator import (
+    INSTRUCTIONS as VALIDATOR_INSTRUCTIONS,
+    ValidationResult,
+    ValidAnswer,
+)
+from .faq_agent import FAQ
+from .generate_response import ResponseToUser, response_maker
+
+
+class FusedRequest(BaseModel):
+    intent: Intent = Field(..., description="Classification of the atomic request.")
+    validation: Optional[ValidationResult] = Field(
+        None,
+        description=(
+            "Validation of the atomic request against the answer requirement. "
+            "Required for `information` and `start` requests, null otherwise."
+        ),
+    )
+
+
+class FusedTurn(BaseModel):
+    requests: list[FusedRequest] = Field(
+        ..., description="Atomic requests of the user's message in the original order."
+    )
+    response: ResponseToUser = Field(..., description="The final reply to the user.")
+
+
+INSTRUCTIONS = f"""
+You process a whole turn of an onboarding dialog in a single pass.
+Do the following steps in order and return all intermediate results:
+
+1. Break the user's message down into atomic requests (see "Separating requests").
+2. Classify every atomic request (see "Classifying requests").
+3. Validate every `information` and `start` request against the answer requirement
+   of the asked question, taking the whole conversation context into account
+   (see "Validating answers"). Do not validate `faq` and `ignore` requests.
+4. Write one final reply to the user (see "Writing the reply"):
+   - answer `faq` requests using the FAQ;
+   - confirm, ask for missing details or deny based on the validation results;
+   - do not reply to `ignore` requests.
+   Set `ready_for_next_question` only if some validation result is valid,
+   and put the extracted answer into `extracted_data`.
+
+# Separating requests
+{SEPARATOR_INSTRUCTIONS}
+
+# Classifying requests
+{ROUTER_INSTRUCTIONS}
+
+# Validating answers
+{VALIDATOR_INSTRUCTIONS}
+
+# Writing the reply
+{response_maker.instructions}
+
+# FAQ
+{FAQ}
+"""
+
+
+def expand_query(
+    user_input: str,
+    question: types.Question,
+    context: str | None = None,
+    instructions: str | None = None,
+) -> str:
+    query = f"""
+**Context of conversation (messages that were in the chat earlier):**
+{context}
+
+Question: "{question.text}"
+
+**Answer requirement:**
+"{question.answer_requirement}"
+
+User's message: "{user_input}"
+"""
+    if instructions:
+        query = f"Strictly follow these instructions before answering: {instructions}\n\n{query}"
+    return query
+
+
+fused_agent = SimpleAgent(
+    name="fused_pipeline",
+    instructions=INSTRUCTIONS,
+    expand_query=expand_query,
+    output_type=FusedTurn,
+    deadline=90,
+)
+
+
+async def generate_fused_response(
+    user_input: str,
+    question: types.Question,
+    context: str | None = None,
+    instructions: str | None = None,
+) -> ResponseToUser | None:
+    """
+    Alternative to `generate_response` which does the separation, routing,
+    validation and reply in one structured model call.
+    Has the same signature, so both can be used by `ChatManager`.
+    """
+    turn = await fused_agent(
+        user_input,
+        question=question,
+        context=context,
+        instructions=instructions,
+    )
+    logging.info(f"generate_fused_response: turn: {turn!r}")
+
+    if all(r.intent.category == "ignore" for r in turn.requests):
+        return None
+
+    # The flag and extracted data are derived from the validation results,
+    # so they mean the same as in the multi-agent pipeline
+    extracted = [
+        r.validation.is_valid.extracted_user_answer
+        for r in turn.requests
+        if r.validation is not None and isinstance(r.validation.is_valid, ValidAnswer)
+    ]
+    return ResponseToUser(
+        user_input=user_input,
+        response_text=turn.response.response_text,
+        extracted_data=" ".join(extracted) if extracted else None,
+        ready_for_next_question=bool(extracted),
+    )
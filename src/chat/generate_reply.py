@@ -56,4 +56,8 @@ async def generate_reply(response: ResponseToUser, state: types.State) -> str:
     return human_reply
 
 
-reply_generator = SimpleAgent(instructions=INSTRUCTIONS)
+reply_generator = SimpleAgent(
+    name="reply_generator",
+    instructions=INSTRUCTIONS,
+    deadline=45,
+)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Optional
 
@@ -6,6 +7,7 @@ from pydantic import BaseModel, Field
 from .simple_agent import SimpleAgent
 
 from src import types
+from src.utils.metrics import metrics
 
 from .router import router, Intent
 from .faq_agent import faq_agent
@@ -18,6 +20,12 @@ from .validator import (
 from .atomic_requests import atomic_separator
 
 
+MAX_CONCURRENT_REQUESTS = 4
+"""
+How many atomic requests of one message are processed at the same time.
+"""
+
+
 class ResponseToUser(BaseModel):
     user_input: str = Field(
         ..., description="The exact text message received from the user."
@@ -38,10 +46,18 @@ async def generate_response(
     question: types.Question,
     context: str | None = None,
     instructions: str | None = None,
+    speculative: bool = False,
 ) -> ResponseToUser | None:
+    """
+    Generates a response to user input using the multi-agent pipeline:
+    atomic separator, then router → faq agent/validator → response maker per request.
+
+    :param speculative: start validation of each request together with its routing
+        instead of waiting for the router's verdict (see `generate_single_response`)
+    """
     requests = await atomic_separator(user_input)
     responses = await get_responses_for_requests(
-        requests.requests, question, context, instructions
+        requests.requests, question, context, instructions, speculative=speculative
     )
     return await combine_responses(user_input, responses)
 
@@ -51,20 +67,31 @@ async def get_responses_for_requests(
     question: types.Question,
     context: str | None,
     instructions: str,
+    max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+    speculative: bool = False,
 ) -> list[ResponseToUser]:
-    responses = []
-    for request in requests:
-        response = await generate_single_response(
-            user_input=request,
-            question=question,
-            context=context,
-            instructions=instructions,
-        )
-        if not response:
-            continue
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def respond(request: str) -> ResponseToUser | None:
+        async with semaphore:
+            return await generate_single_response(
+                user_input=request,
+                question=question,
+                context=context,
+                instructions=instructions,
+                speculative=speculative,
+            )
 
-        responses.append(response)
-    return responses
+    # A failed request cancels the others, their results would be thrown away.
+    # Tasks are kept in the order of requests, which `combine_responses` relies on
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(respond(request)) for request in requests]
+    except ExceptionGroup as e:
+        # Callers expect the error itself, as with a single request
+        raise e.exceptions[0]
+    responses = [task.result() for task in tasks]
+    return [response for response in responses if response]
 
 
 async def combine_responses(
@@ -115,19 +142,39 @@ async def generate_single_response(
     question: types.Question,
     context: str | None = None,
     instructions: str | None = None,
+    speculative: bool = False,
 ) -> ResponseToUser | None:
-    intent = await router(
-        user_input,
-        context=context,
-        instructions=instructions,
-        question=question.text,
-    )
+    """
+    Routes a single atomic request and produces a response to it.
+
+    In speculative mode the information branch (validator + response maker)
+    is started together with the router, because most messages turn out to be
+    `information`. If the router picks another branch, the speculation is cancelled.
+    """
+    speculation = None
+    if speculative:
+        speculation = asyncio.create_task(
+            evaluate_user_information(user_input, question, context, instructions)
+        )
+
+    try:
+        intent = await router(
+            user_input,
+            context=context,
+            instructions=instructions,
+            question=question.text,
+        )
+    except BaseException:
+        _discard_speculation(speculation)
+        raise
     logging.info(f"generate_single_response: intent: {intent}")
 
     match intent:
         case Intent(category="ignore"):
+            _discard_speculation(speculation)
             return None
         case Intent(category="faq"):
+            _discard_speculation(speculation)
             # TODO: Возможно, стоит вынести в отдельную функцию
             agent_response = await faq_agent(
                 user_input,
@@ -142,11 +189,24 @@ async def generate_single_response(
                 ready_for_next_question=False,
             )
         case _:
+            if speculation is not None:
+                metrics.increment("speculative_routing.hits")
+                return await speculation
             return await evaluate_user_information(
                 user_input, question, context, instructions
             )
 
 
+def _discard_speculation(speculation: asyncio.Task | None) -> None:
+    if speculation is None:
+        return
+
+    metrics.increment("speculative_routing.misses")
+    speculation.cancel()
+    # Retrieve a possible failure so it is not reported as never retrieved
+    speculation.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+
 def expand_query(prompt: str, instructions: str | None = None) -> str:
     if instructions:
         query = f"Strictly follow these instructions before answering: {instructions}\n\n{prompt}"
@@ -156,6 +216,7 @@ def expand_query(prompt: str, instructions: str | None = None) -> str:
 
 
 response_maker = SimpleAgent(
+    name="response_maker",
     instructions="""
 You're a chill, straight-talking assistant who checks if the user's info meets our rules. Your job is to reply with one of three responses—**confirmation**, **partial answer**, or **denial**—in a short, casual, and respectful way.
 
@@ -232,6 +293,7 @@ You're a chill, straight-talking assistant who checks if the user's info meets o
   “We handle over ₹12,000,000+ in daily incoming transactions, focusing on safe, long-term work.”
 """,
     expand_query=expand_query,
+    deadline=45,
 )
 
 
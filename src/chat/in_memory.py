@@ -22,6 +22,13 @@ class InMemoryQuestionList(types.QuestionList):
             return self._questions[idx]
         return None
 
+    async def current_question_index(self, user_id: int) -> int | None:
+        idx = self._indices.get(user_id, 0)
+        return idx if idx < len(self._questions) else None
+
+    async def remaining_questions(self, user_id: int) -> list[types.Question]:
+        return self._questions[self._indices.get(user_id, 0) :]
+
     async def advance(self, user_id: int, answer: str) -> None:
         # Initialize user data if not present
         if user_id not in self._indices:
@@ -59,24 +66,70 @@ class InMemoryUserAnswerStorage(types.UserAnswerStorage):
     """
 
     def __init__(self) -> None:
-        self._store: dict[int, str | None] = {}
+        self._store: dict[int, list[tuple[int, str]]] = {}
+        self._next_id = 1
+
+    def _segment(self, text: str) -> tuple[int, str]:
+        segment = (self._next_id, text)
+        self._next_id += 1
+        return segment
 
     async def append(self, user_id: int, partial_answer: str) -> None:
         """
         Appends the draft response for a given user.
         """
-        current = self._store.get(user_id)
-        # Initialize or append with newline
-        self._store[user_id] = (current + "\n" if current else "") + partial_answer
+        self._store.setdefault(user_id, []).append(self._segment(partial_answer))
 
     async def get(self, user_id: int) -> str | None:
         """
         Retrieves the current draft response, if any.
         """
-        return self._store.get(user_id)
+        segments = self._store.get(user_id)
+        # Parts are joined with newline
+        return "\n".join(text for _, text in segments) if segments else None
 
     async def clear(self, user_id: int) -> None:
         """
         Removes any saved draft for the specified user.
         """
-        self._store[user_id] = None
+        self._store.pop(user_id, None)
+
+    async def replace(self, user_id: int, new_answer: str) -> None:
+        """
+        Replaces the saved draft with a new one.
+        """
+        self._store[user_id] = [self._segment(new_answer)]
+
+    async def segments(self, user_id: int) -> list[tuple[int, str]]:
+        """
+        Retrieves the appended parts of the draft.
+        """
+        return list(self._store.get(user_id, []))
+
+    async def replace_up_to(
+        self, user_id: int, segment_id: int, new_answer: str
+    ) -> bool:
+        """
+        Replaces the parts up to `segment_id` with a new one.
+        """
+        segments = self._store.get(user_id, [])
+        for i, (id_, _) in enumerate(segments):
+            if id_ == segment_id:
+                self._store[user_id] = [(segment_id, new_answer), *segments[i + 1 :]]
+                return True
+        return False
+
+
+class InMemoryUserInfoStorage(types.UserInfoStorage):
+    """
+    In-memory storage of information extracted from answers per user.
+    """
+
+    def __init__(self) -> None:
+        self._store: dict[int, tuple[dict, int]] = {}
+
+    async def get(self, user_id: int) -> tuple[dict, int] | None:
+        return self._store.get(user_id)
+
+    async def save(self, user_id: int, info: dict, answered: int) -> None:
+        self._store[user_id] = (info, answered)
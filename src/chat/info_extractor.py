@@ -111,12 +111,57 @@ def expand_query(user_input: str) -> str:
 
 
 info_extractor = SimpleAgent(
+    name="info_extractor",
     instructions=INSTRUCTIONS,
     expand_query=expand_query,
     output_type=UserInformation,
+    deadline=120,
 )
 
 
 async def extract_info(qa_pairs: list[types.QaPair]) -> UserInformation:
     qa = "\n".join(f"Q: {q.question}\nA: {q.answer}\n" for q in qa_pairs)
     return await info_extractor(qa)
+
+
+UPDATE_INSTRUCTIONS = f"""
+{INSTRUCTIONS}
+The information is collected incrementally: you get the information extracted
+from previous answers (as JSON, absent for the first answer) and one newly
+answered question.
+Return the previous information updated with the new answer:
+- keep everything from the previous information unless the new answer corrects it;
+- add what the new answer tells;
+- leave strings empty and lists empty for things nobody has told yet.
+"""
+
+
+def expand_update_query(user_input: str, info: UserInformation | None) -> str:
+    previous = info.model_dump_json(indent=2) if info else "No information yet."
+    return (
+        f"Previous information:\n{previous}\n\n"
+        f"Update it with the following Q&A pair:\n{user_input}"
+    )
+
+
+info_updater = SimpleAgent(
+    name="info_updater",
+    instructions=UPDATE_INSTRUCTIONS,
+    expand_query=expand_update_query,
+    output_type=UserInformation,
+    deadline=60,
+)
+
+
+async def update_info(
+    info: UserInformation | None, question: str, answer: str
+) -> UserInformation:
+    """
+    Merges a single newly answered question into previously extracted information.
+
+    :param info: information extracted from the previous answers
+    :param question: text of the answered question
+    :param answer: the user's answer
+    :return: the updated information
+    """
+    return await info_updater(f"Q: {question}\nA: {answer}\n", info=info)
@@ -0,0 +1,283 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Iterator
+import asyncio
+import heapq
+import itertools
+import time
+
+from src.utils.metrics import metrics
+
+COMPLETION_ESTIMATE = 256
+"""
+Tokens reserved for the completion of a call, reconciled with the actual usage.
+"""
+
+
+class Priority(IntEnum):
+    """
+    Priority lanes of the scheduler, lower value is served first.
+    """
+
+    INTERACTIVE = 0
+    """Live replies to users."""
+
+    BACKGROUND = 1
+    """Work triggered by a dialog but not awaited by the user (processors, summaries)."""
+
+    BATCH = 2
+    """Admin exports and other bulk jobs."""
+
+
+_priority: ContextVar[Priority] = ContextVar(
+    "llm_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """
+    Runs LLM calls made inside the block (and in tasks created from it) in the given lane.
+
+    :param level: priority lane
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    """
+    :return: priority lane of the current context
+    """
+    return _priority.get()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously up to its capacity.
+    The level may go negative when actual usage exceeds the reserved amount.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(
+            self.capacity, self._tokens + elapsed * self.refill_per_second
+        )
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        :param amount: tokens required
+        :return: seconds until `amount` tokens are available (0 if available now)
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """
+        Corrects a previous reservation by `delta` tokens (positive means more were used).
+        """
+        self._refill()
+        self._tokens -= delta
+
+
+class LlmScheduler:
+    """
+    Central gate every agent call passes through before hitting the provider.
+    Enforces request-per-minute and token-per-minute budgets and serves
+    waiting calls strictly by priority lane, then in arrival order.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ) -> None:
+        """
+        :param requests_per_minute: provider RPM limit (unlimited if unset)
+        :param tokens_per_minute: provider TPM limit (unlimited if unset)
+        """
+        self._requests = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60)
+            if requests_per_minute
+            else None
+        )
+        self._tokens = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+            if tokens_per_minute
+            else None
+        )
+        # (priority, arrival, estimated tokens, waiter)
+        self._queue: list[tuple[int, int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+
+    @property
+    def limited(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    @staticmethod
+    def estimate_tokens(params: dict[str, Any]) -> int:
+        """
+        Rough token estimate of a chat completion call (4 characters per token
+        for the prompt plus a typical completion), reconciled after the call.
+        """
+        prompt_chars = sum(len(m["content"]) for m in params.get("messages", ()))
+        return prompt_chars // 4 + COMPLETION_ESTIMATE
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """
+        Waits until the call may be sent to the provider.
+
+        :param estimated_tokens: tokens reserved for the call
+        """
+        lane = current_priority()
+        if not self.limited:
+            metrics.increment(f"llm_scheduler.{lane.name.lower()}.granted")
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queue, (lane, next(self._arrivals), estimated_tokens, waiter)
+        )
+        self._report_depth()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+        queued_at = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted right before cancellation: give the tokens back
+                self._release(estimated_tokens)
+            raise
+        metrics.observe(
+            f"llm_scheduler.{lane.name.lower()}.wait_s", time.monotonic() - queued_at
+        )
+
+    def record_cancelled(self, estimated_tokens: int) -> None:
+        """
+        Reconciles the reservation of a call cancelled before its response:
+        the prompt was already sent, but no completion is generated.
+
+        :param estimated_tokens: tokens reserved in `acquire`
+        """
+        if self._tokens is not None:
+            self._tokens.adjust(-min(COMPLETION_ESTIMATE, estimated_tokens))
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int | None) -> None:
+        """
+        Reconciles the reservation with the actual usage reported by the provider.
+
+        :param estimated_tokens: tokens reserved in `acquire`
+        :param used_tokens: total tokens of the call (None if unknown)
+        """
+        if self._tokens is not None and used_tokens is not None:
+            self._tokens.adjust(used_tokens - estimated_tokens)
+
+    def _release(self, estimated_tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.adjust(-1)
+        if self._tokens is not None:
+            self._tokens.adjust(-estimated_tokens)
+
+    def _report_depth(self) -> None:
+        depth = dict.fromkeys(Priority, 0)
+        for lane, _, _, waiter in self._queue:
+            if not waiter.done():
+                depth[Priority(lane)] += 1
+        for lane, count in depth.items():
+            metrics.set(f"llm_scheduler.{lane.name.lower()}.queue_depth", count)
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            lane, _, estimated_tokens, waiter = self._queue[0]
+            if waiter.done():
+                # Cancelled while waiting
+                heapq.heappop(self._queue)
+                self._report_depth()
+                continue
+
+            delay = max(
+                self._requests.wait_time(1) if self._requests else 0.0,
+                self._tokens.wait_time(estimated_tokens) if self._tokens else 0.0,
+            )
+            if delay > 0:
+                # Re-check early if a more urgent call arrives meanwhile
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            if self._requests is not None:
+                self._requests.consume(1)
+            if self._tokens is not None:
+                self._tokens.consume(estimated_tokens)
+            waiter.set_result(None)
+            metrics.increment(f"llm_scheduler.{Priority(lane).name.lower()}.granted")
+            self._report_depth()
+
+    async def close(self) -> None:
+        """
+        Stops the dispatcher and fails calls which are still waiting.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, _, waiter in self._queue:
+            if not waiter.done():
+                waiter.cancel()
+        self._queue.clear()
+
+
+_scheduler = LlmScheduler()
+
+
+def configure(
+    requests_per_minute: int | None = None,
+    tokens_per_minute: int | None = None,
+) -> None:
+    """
+    Replaces the process-wide scheduler. Should be called once at startup.
+
+    :param requests_per_minute: provider RPM limit (unlimited if unset)
+    :param tokens_per_minute: provider TPM limit (unlimited if unset)
+    """
+    global _scheduler
+    _scheduler = LlmScheduler(requests_per_minute, tokens_per_minute)
+
+
+def get_scheduler() -> LlmScheduler:
+    """
+    :return: the process-wide scheduler
+    """
+    return _scheduler
@@ -0,0 +1,254 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+import aiosqlite
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class ResponseCacheSettings:
+    """
+    Settings of the two-tier agent response cache.
+    """
+
+    enabled: bool = True
+    """
+    Global switch; agents without `cache=True` are never cached anyway.
+    """
+
+    memory_size: int = 1024
+    """
+    Maximum number of responses kept in the in-process LRU tier.
+    """
+
+    memory_ttl: float = 3600.0
+    """
+    Seconds a response stays valid in the in-process tier.
+    """
+
+    sqlite_path: str | None = None
+    """
+    Path to the SQLite file of the persistent tier (disabled if unset).
+    """
+
+    sqlite_ttl: float = 7 * 24 * 3600.0
+    """
+    Seconds a response stays valid in the persistent tier.
+    """
+
+
+class LruCache:
+    """
+    In-memory LRU cache with per-entry expiration.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        # key → (expires_at, value), least recently used first
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class SqliteCache:
+    """
+    Persistent cache tier stored in its own SQLite file, so it survives restarts
+    and does not compete with the bot database for the write lock.
+
+    Expired rows are deleted when the file is opened and every `prune_every` writes.
+    """
+
+    def __init__(self, path: str, ttl: float, prune_every: int = 1000) -> None:
+        """
+        :param path: path to the SQLite file
+        :param ttl: seconds a response stays valid
+        :param prune_every: writes between deletions of expired rows
+        """
+        self.path = path
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        self._db: aiosqlite.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        async with self._lock:
+            if self._db is None:
+                self._db = await aiosqlite.connect(self.path)
+                await self._db.execute("PRAGMA journal_mode=WAL")
+                await self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                await self._prune(self._db)
+            return self._db
+
+    async def _prune(self, db: aiosqlite.Connection) -> None:
+        # Expired rows are never read, but would keep the file growing
+        cursor = await db.execute(
+            "DELETE FROM response_cache WHERE created_at < ?",
+            (time.time() - self.ttl,),
+        )
+        await db.commit()
+        if cursor.rowcount > 0:
+            logger.info(f"Deleted {cursor.rowcount} expired cached responses")
+
+    async def get(self, key: str) -> str | None:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT value FROM response_cache WHERE key = ? AND created_at >= ?",
+            (key, time.time() - self.ttl),
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set(self, key: str, value: str) -> None:
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, created_at) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+        await db.commit()
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            await self._prune(db)
+
+    async def clear(self) -> None:
+        db = await self._connection()
+        await db.execute("DELETE FROM response_cache")
+        await db.commit()
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+class ResponseCache:
+    """
+    Two-tier cache of agent responses: a fast in-process LRU in front of
+    a persistent SQLite tier. Values are serialized strings.
+    """
+
+    def __init__(self, settings: ResponseCacheSettings) -> None:
+        self.settings = settings
+        self.memory = LruCache(settings.memory_size, settings.memory_ttl)
+        self.sqlite = (
+            SqliteCache(settings.sqlite_path, settings.sqlite_ttl)
+            if settings.sqlite_path
+            else None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    async def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None or self.sqlite is None:
+            return value
+
+        try:
+            value = await self.sqlite.get(key)
+        except Exception as e:
+            logger.error(f"Response cache read failed: {e}")
+            return None
+
+        if value is not None:
+            # Promote to the in-process tier for the next lookups
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.sqlite is None:
+            return
+
+        try:
+            await self.sqlite.set(key, value)
+        except Exception as e:
+            logger.error(f"Response cache write failed: {e}")
+
+    async def clear(self) -> None:
+        self.memory.clear()
+        if self.sqlite is not None:
+            await self.sqlite.clear()
+
+    async def close(self) -> None:
+        if self.sqlite is not None:
+            await self.sqlite.close()
+
+
+_cache = ResponseCache(ResponseCacheSettings())
+
+
+def configure(settings: ResponseCacheSettings) -> None:
+    """
+    Replaces the process-wide cache. Should be called once at startup.
+
+    :param settings: cache settings
+    """
+    global _cache
+    _cache = ResponseCache(settings)
+
+
+def get_cache() -> ResponseCache:
+    """
+    :return: the process-wide response cache
+    """
+    return _cache
+
+
+def make_key(
+    instructions: str,
+    user_input: str,
+    model_settings: dict,
+    output_type: type | None,
+) -> str:
+    """
+    Builds a stable cache key for a single agent call.
+
+    :param instructions: system instructions of the agent
+    :param user_input: user input after query expansion
+    :param model_settings: effective model settings
+    :param output_type: expected structured output type, if any
+    :return: hex digest identifying the call
+    """
+    output_type_name = (
+        f"{output_type.__module__}.{output_type.__qualname__}" if output_type else None
+    )
+    payload = json.dumps(
+        [instructions, user_input, model_settings, output_type_name],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
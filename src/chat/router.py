@@ -141,7 +141,12 @@ def expand_query(
 
 
 router = SimpleAgent(
+    name="router",
     instructions=INSTRUCTIONS,
     expand_query=expand_query,
     output_type=Intent,
+    cache=True,
+    deadline=30,
+    hedge=True,
+    coalesce=True,
 )
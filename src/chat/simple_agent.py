@@ -1,15 +1,46 @@
 from dataclasses import dataclass, field
 from typing import Any, Callable
-import os
+import asyncio
+import random
+import time
 
+import openai
 from openai import AsyncOpenAI
 
+from src.utils.metrics import metrics
+
+from . import client_pool
+from . import llm_scheduler
+from . import response_cache
+from . import usage
+from .singleflight import SingleFlight
+
 DEFAULT_MODEL_SETTINGS = dict(
     temperature=0,
     max_tokens=4096,
     model="gpt-4o",
 )
 
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+"""
+Errors after which the same request may succeed when sent again.
+"""
+
+MIN_HEDGE_SAMPLES = 20
+"""
+How many latency samples an agent needs before its p95 is trusted for hedging.
+"""
+
+_in_flight = SingleFlight()
+"""
+Pending completions shared by identical concurrent calls of all agents.
+"""
+
 
 @dataclass(kw_only=True)
 class SimpleAgent:
@@ -23,6 +54,11 @@ class SimpleAgent:
     Instructions for the agent to follow when generating responses.
     """
 
+    name: str = "agent"
+    """
+    Name of the agent used in logs and metrics.
+    """
+
     expand_query: Callable | None = None
     """
     Callable that enriches user input with additional context.
@@ -48,14 +84,47 @@ class SimpleAgent:
     OpenAI API endpoint URL (defaults to environment variable if unset).
     """
 
+    timeout: float | None = None
+    """
+    Per-call request timeout in seconds (defaults to the pool-wide timeout if unset).
+    """
+
+    cache: bool = False
+    """
+    Whether responses may be served from the shared response cache.
+    Enable it only for agents whose output depends on the prompt alone.
+    """
+
+    deadline: float | None = None
+    """
+    Overall time budget of a call in seconds, including retries (unlimited if unset).
+    """
+
+    max_retries: int = 2
+    """
+    How many times a request is repeated after a retryable error.
+    """
+
+    retry_backoff: float = 0.5
+    """
+    Base delay in seconds of the jittered exponential backoff between retries.
+    """
+
+    hedge: bool = False
+    """
+    Whether a duplicate request is fired when the first one is slower than
+    the agent's p95 latency; the first response to arrive wins.
+    """
+
+    coalesce: bool = False
+    """
+    Whether identical concurrent calls share one pending completion.
+    Like `cache`, enable it only for agents whose output depends on the prompt alone.
+    """
+
     @property
     def client(self) -> AsyncOpenAI:
-        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
-        base_url = self.base_url or os.getenv("OPENAI_API_BASE_URL")
-        return AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-        )
+        return client_pool.get_client(self.api_key, self.base_url)
 
     async def __call__(self, user_input: str, **query_expansion_kwargs) -> str:
         """
@@ -79,11 +148,151 @@ class SimpleAgent:
             messages=messages,
             **model_settings,
         )
+        if self.timeout is not None:
+            params["timeout"] = self.timeout
+
+        cache = response_cache.get_cache()
+        use_cache = self.cache and cache.enabled
+        if not (use_cache or self.coalesce):
+            return await self._complete(params)
+
+        key = response_cache.make_key(
+            self.instructions, user_input, model_settings, self.output_type
+        )
+        if use_cache:
+            cached = await cache.get(key)
+            if cached is not None:
+                metrics.increment(f"{self.name}.cache_hits")
+                return self._deserialize(cached)
+            metrics.increment(f"{self.name}.cache_misses")
+
+        async def complete() -> Any:
+            result = await self._complete(params)
+            if use_cache and result is not None:
+                await cache.set(key, self._serialize(result))
+            return result
+
+        if not self.coalesce:
+            return await complete()
+
+        if _in_flight.in_flight(key):
+            metrics.increment(f"{self.name}.coalesced")
+        return await _in_flight.do(key, complete)
+
+    async def _complete(self, params: dict) -> Any:
+        try:
+            async with asyncio.timeout(self.deadline):
+                return await self._complete_with_retries(params)
+        except TimeoutError:
+            metrics.increment(f"{self.name}.timeouts")
+            raise
+
+    async def _complete_with_retries(self, params: dict) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged_request(params)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.APITimeoutError):
+                    metrics.increment(f"{self.name}.timeouts")
+                if attempt >= self.max_retries:
+                    raise
+
+            # Full jitter keeps retries of concurrent calls from hitting the API in sync
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2**attempt))
+            attempt += 1
+            metrics.increment(f"{self.name}.retries")
+
+    async def _hedged_request(self, params: dict) -> Any:
+        hedge_after = self._hedge_delay()
+        if hedge_after is None:
+            return await self._request(params)
+
+        # The hedge timer starts once the scheduler lets the call through:
+        # waiting in its queue is no reason to send a second request
+        estimated_tokens = await self._acquire(params)
+        pending = {asyncio.create_task(self._send(params, estimated_tokens))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return done.pop().result()
+
+            metrics.increment(f"{self.name}.hedges")
+            hedged = asyncio.create_task(self._request(params))
+            pending.add(hedged)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if hedged in succeeded:
+                        metrics.increment(f"{self.name}.hedge_wins")
+                    return succeeded[0].result()
+            # Both requests failed
+            raise done.pop().exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> float | None:
+        if not self.hedge:
+            return None
+        if len(metrics.samples(f"{self.name}.latency_s")) < MIN_HEDGE_SAMPLES:
+            return None
+        return metrics.percentile(f"{self.name}.latency_s", 95)
+
+    async def _acquire(self, params: dict) -> int:
+        """
+        :return: tokens reserved for the call
+        """
+        scheduler = llm_scheduler.get_scheduler()
+        estimated_tokens = scheduler.estimate_tokens(params)
+        await scheduler.acquire(estimated_tokens)
+        return estimated_tokens
+
+    async def _request(self, params: dict) -> Any:
+        return await self._send(params, await self._acquire(params))
+
+    async def _send(self, params: dict, estimated_tokens: int) -> Any:
+        scheduler = llm_scheduler.get_scheduler()
+        started_at = time.perf_counter()
+        try:
+            if self.output_type is None:
+                response = await self.client.chat.completions.create(**params)
+                result = response.choices[0].message.content
+            else:
+                response = await self.client.beta.chat.completions.parse(
+                    **params, response_format=self.output_type
+                )
+                result = response.choices[0].message.parsed
+        except asyncio.CancelledError:
+            # E.g. the losing request of a hedge
+            scheduler.record_cancelled(estimated_tokens)
+            raise
+        latency = time.perf_counter() - started_at
+        metrics.observe(f"{self.name}.latency_s", latency)
+
+        if response.usage is None:
+            scheduler.record_usage(estimated_tokens, None)
+            return result
+
+        scheduler.record_usage(estimated_tokens, response.usage.total_tokens)
+        usage.record(
+            agent=self.name,
+            model=response.model,
+            prompt_tokens=response.usage.prompt_tokens,
+            completion_tokens=response.usage.completion_tokens,
+            latency=latency,
+        )
+        return result
 
+    def _serialize(self, result: Any) -> str:
         if self.output_type is None:
-            response = await self.client.chat.completions.create(**params)
-            return response.choices[0].message.content
+            return result
+        return result.model_dump_json()
 
-        params["response_format"] = self.output_type
-        response = await self.client.beta.chat.completions.parse(**params)
-        return response.choices[0].message.parsed
+    def _deserialize(self, value: str) -> Any:
+        if self.output_type is None:
+            return value
+        return self.output_type.model_validate_json(value)
@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+import asyncio
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution:
+    the first caller starts the work and everyone arriving while it is
+    still running awaits the same result.
+
+    The work runs in its own task, so one caller giving up does not cancel
+    it for the others; it is cancelled only when every caller has gone.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `fn` unless a call with the same key is already running,
+        in which case waits for that call instead.
+
+        :param key: identity of the call
+        :param fn: zero-argument coroutine function doing the work
+        :return: result of the (possibly shared) call
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Forgotten right away, so callers arriving before the task
+                # has finished cancelling start a fresh flight
+                self._forget(key, flight)
+                flight.task.cancel()
+            raise
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
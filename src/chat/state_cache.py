@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from src import types
+from src.utils.metrics import metrics
+
+from . import unit_of_work
+
+_MISSING = object()
+
+
+class _UserStateCache:
+    """
+    Per-user dictionaries of cached values with LRU eviction of whole users.
+    """
+
+    def __init__(self, name: str, max_users: int) -> None:
+        self._name = name
+        self._max_users = max_users
+        self._entries: OrderedDict[int, dict[str, Any]] = OrderedDict()
+
+    def entry(self, user_id: int) -> dict[str, Any]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = {}
+            if len(self._entries) > self._max_users:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(user_id)
+        return entry
+
+    async def get_or_load(
+        self, user_id: int, key: str, load: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        # The entry is taken before loading: if the user is invalidated
+        # meanwhile, the loaded value goes to the detached entry and is lost
+        entry = self.entry(user_id)
+        value = entry.get(key, _MISSING)
+        if value is _MISSING:
+            metrics.increment(f"{self._name}.misses")
+            value = entry[key] = await load()
+        else:
+            metrics.increment(f"{self._name}.hits")
+        return value
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def written(self, user_id: int) -> None:
+        """
+        Must be called on every write: values cached for the user are
+        only valid if the write is committed.
+        """
+        unit_of_work.on_rollback(lambda: self.invalidate(user_id))
+
+
+class CachedQuestionList(types.QuestionList):
+    """
+    Write-through cache of per-user progress in front of another `QuestionList`.
+
+    Every change must go through this object: values are cached in process memory,
+    so changes made by other processes must be followed by `invalidate`.
+    """
+
+    def __init__(self, question_list: types.QuestionList, max_users: int = 10_000):
+        """
+        :param question_list: the underlying question list
+        :param max_users: how many users are kept, least recently used are evicted
+        """
+        self.question_list = question_list
+        self._cache = _UserStateCache("state_cache.questions", max_users)
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        """
+        Drops cached values of a user (or of everyone), e.g. after a rolled back write.
+
+        :param user_id: identifier for the conversation participant
+        """
+        self._cache.invalidate(user_id)
+
+    async def has_user_started(self, user_id: int) -> bool:
+        return await self._cache.get_or_load(
+            user_id, "started", lambda: self.question_list.has_user_started(user_id)
+        )
+
+    async def current_question(self, user_id: int) -> types.Question | None:
+        return await self._cache.get_or_load(
+            user_id, "question", lambda: self.question_list.current_question(user_id)
+        )
+
+    async def current_question_index(self, user_id: int) -> int | None:
+        return await self._cache.get_or_load(
+            user_id,
+            "index",
+            lambda: self.question_list.current_question_index(user_id),
+        )
+
+    async def remaining_questions(self, user_id: int) -> list[types.Question]:
+        remaining = await self._cache.get_or_load(
+            user_id,
+            "remaining",
+            lambda: self.question_list.remaining_questions(user_id),
+        )
+        return list(remaining)
+
+    async def advance(self, user_id: int, answer: str) -> None:
+        self._cache.written(user_id)
+        try:
+            await self.question_list.advance(user_id, answer)
+        finally:
+            self._cache.invalidate(user_id)
+        self._cache.entry(user_id)["started"] = True
+
+    async def all_finished(self, user_id: int) -> bool:
+        return await self._cache.get_or_load(
+            user_id, "finished", lambda: self.question_list.all_finished(user_id)
+        )
+
+    async def qa_pairs(self, user_id: int) -> list[types.QaPair]:
+        pairs = await self._cache.get_or_load(
+            user_id, "qa_pairs", lambda: self.question_list.qa_pairs(user_id)
+        )
+        return list(pairs)
+
+    async def stop_talking_with(self, user_id: int) -> None:
+        self._cache.written(user_id)
+        try:
+            await self.question_list.stop_talking_with(user_id)
+        finally:
+            self._cache.invalidate(user_id)
+
+
+class CachedUserAnswerStorage(types.UserAnswerStorage):
+    """
+    Write-through cache of partial answers in front of another `UserAnswerStorage`.
+
+    Every change must go through this object: values are cached in process memory,
+    so changes made by other processes must be followed by `invalidate`.
+    """
+
+    def __init__(
+        self, user_answer_storage: types.UserAnswerStorage, max_users: int = 10_000
+    ):
+        """
+        :param user_answer_storage: the underlying storage
+        :param max_users: how many users are kept, least recently used are evicted
+        """
+        self.user_answer_storage = user_answer_storage
+        self._cache = _UserStateCache("state_cache.answers", max_users)
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        """
+        Drops the cached answer of a user (or of everyone), e.g. after a rolled back write.
+
+        :param user_id: identifier for the conversation participant
+        """
+        self._cache.invalidate(user_id)
+
+    async def append(self, user_id: int, partial_answer: str) -> None:
+        # How answers are joined is up to the underlying storage,
+        # so the next read fetches the result
+        self._cache.written(user_id)
+        try:
+            await self.user_answer_storage.append(user_id, partial_answer)
+        finally:
+            self._cache.invalidate(user_id)
+
+    async def get(self, user_id: int) -> str | None:
+        return await self._cache.get_or_load(
+            user_id, "answer", lambda: self.user_answer_storage.get(user_id)
+        )
+
+    async def clear(self, user_id: int) -> None:
+        self._cache.written(user_id)
+        self._cache.invalidate(user_id)
+        await self.user_answer_storage.clear(user_id)
+        self._cache.entry(user_id)["answer"] = None
+
+    async def replace(self, user_id: int, new_answer: str) -> None:
+        self._cache.written(user_id)
+        self._cache.invalidate(user_id)
+        await self.user_answer_storage.replace(user_id, new_answer)
+        self._cache.entry(user_id)["answer"] = new_answer
+
+    async def segments(self, user_id: int) -> list[tuple[int, str]]:
+        # Only read by compaction, not worth caching
+        return await self.user_answer_storage.segments(user_id)
+
+    async def replace_up_to(
+        self, user_id: int, segment_id: int, new_answer: str
+    ) -> bool:
+        self._cache.written(user_id)
+        try:
+            return await self.user_answer_storage.replace_up_to(
+                user_id, segment_id, new_answer
+            )
+        finally:
+            self._cache.invalidate(user_id)
+
+
+class CachedContext(types.Context):
+    """
+    Cached copy of the learned instructions in front of another `Context`.
+    They are read on every turn but only change with `/learn` and `/forget`.
+
+    Every change must go through this object: the value is cached in process memory,
+    so changes made by other processes must be followed by `invalidate`.
+    """
+
+    def __init__(self, context: types.Context):
+        """
+        :param context: the underlying context
+        """
+        self.context = context
+        # Changed by every write, a value loaded meanwhile is not cached
+        self.version = 0
+        self._cached: tuple[int, str | None] | None = None
+
+    def invalidate(self) -> None:
+        """
+        Drops the cached value, e.g. after the instructions were changed elsewhere.
+        """
+        self.version += 1
+
+    async def get(self) -> str | None:
+        version = self.version
+        if self._cached is not None and self._cached[0] == version:
+            metrics.increment("state_cache.context.hits")
+            return self._cached[1]
+
+        metrics.increment("state_cache.context.misses")
+        value = await self.context.get()
+        if self.version == version:
+            self._cached = (version, value)
+        return value
+
+    async def append(self, information: str) -> None:
+        await self._write(self.context.append(information))
+
+    async def clear(self) -> None:
+        await self._write(self.context.clear())
+
+    async def replace(self, information: str) -> None:
+        await self._write(self.context.replace(information))
+
+    async def _write(self, write: Awaitable[None]) -> None:
+        # Bumped on both sides, so reads overlapping the write are not cached
+        self.version += 1
+        try:
+            await write
+        finally:
+            self.version += 1
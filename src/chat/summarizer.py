@@ -69,6 +69,42 @@ def expand_query(context: str, question: str | None = None) -> str:
 
 
 summarizer = simple_agent.SimpleAgent(
+    name="summarizer",
     instructions=INSTRUCTIONS,
     expand_query=expand_query,
+    deadline=60,
 )
+
+
+MERGE_INSTRUCTIONS = """
+### ROLE ###
+
+Act as an editor of the instructions given to a customer support bot by its operators.
+
+### TASK ###
+
+The operators add instructions one at a time, so the given text is a list of separate
+notes which can repeat, overlap or contradict each other. Merge them into one block of instructions:
+
+1. Keep every distinct rule, with all of its details (names, numbers, wording the bot must use).
+2. Merge duplicated and overlapping rules into one.
+3. If rules contradict each other, keep the one given later.
+4. Examples of incorrect answers only explain a rule: keep them short or drop them if the rule is clear without them.
+
+### CONSTRAINTS ###
+
+- **Style:** A short list of imperative rules addressed to the bot.
+- **Do Not:** Add rules which are not in the given text.
+- **Output:** Only the merged instructions, without any comments.
+"""
+
+
+instructions_merger = simple_agent.SimpleAgent(
+    name="instructions_merger",
+    instructions=MERGE_INSTRUCTIONS,
+    deadline=60,
+)
+
+
+async def merge_instructions(instructions: str) -> str:
+    return await instructions_merger(instructions)
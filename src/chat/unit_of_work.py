@@ -0,0 +1,86 @@
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+
+from src.utils.metrics import metrics
+
+type TransactionFactory = Callable[[], AbstractAsyncContextManager]
+"""
+Callable which opens a database transaction, e.g. Tortoise `in_transaction`.
+"""
+
+
+@dataclass
+class _UnitOfWork:
+    after_commit: list[Callable[[], Awaitable[None]]] = field(default_factory=list)
+    on_rollback: list[Callable[[], None]] = field(default_factory=list)
+
+
+_current: ContextVar[_UnitOfWork | None] = ContextVar("unit_of_work", default=None)
+
+
+@asynccontextmanager
+async def unit_of_work(
+    transaction: TransactionFactory | None = None,
+) -> AsyncIterator[None]:
+    """
+    Groups state writes made inside the block into one transaction.
+    Blocks nested in an active unit of work join it.
+
+    Only storage writes belong inside: agent calls would keep the transaction
+    (and, on SQLite, the whole database) locked for seconds.
+
+    :param transaction: opens the transaction (writes are not grouped if None)
+    """
+    if _current.get() is not None:
+        yield
+        return
+
+    work = _UnitOfWork()
+    token = _current.set(work)
+    try:
+        if transaction is None:
+            yield
+        else:
+            async with transaction():
+                yield
+    except BaseException:
+        _current.reset(token)
+        metrics.increment("unit_of_work.rollbacks")
+        for callback in work.on_rollback:
+            callback()
+        raise
+
+    # Callbacks run outside of the transaction, so their queries (and tasks
+    # they start) do not use its connection
+    _current.reset(token)
+    metrics.increment("unit_of_work.commits")
+    for callback in work.after_commit:
+        await callback()
+
+
+async def after_commit(callback: Callable[[], Awaitable[None]]) -> None:
+    """
+    Runs the callback once the active unit of work is committed
+    (right away if there is none). Nothing is run on rollback.
+
+    :param callback: zero-argument coroutine function
+    """
+    work = _current.get()
+    if work is None:
+        await callback()
+    else:
+        work.after_commit.append(callback)
+
+
+def on_rollback(callback: Callable[[], None]) -> None:
+    """
+    Runs the callback if the active unit of work is rolled back,
+    e.g. to drop cached values of writes which never happened.
+
+    :param callback: zero-argument function
+    """
+    work = _current.get()
+    if work is not None:
+        work.on_rollback.append(callback)
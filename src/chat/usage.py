@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+import datetime
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+"""
+USD per one million (prompt, completion) tokens, matched by model name prefix.
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class UsageRecord:
+    """Token usage and latency of a single completion request."""
+
+    agent: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    user_id: int | None = None
+    question_index: int | None = None
+    created_at: datetime.datetime = field(
+        default_factory=lambda: datetime.datetime.now(datetime.UTC)
+    )
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        """Estimated cost in USD (0 for models with unknown prices)."""
+        prices = price_of(self.model)
+        if prices is None:
+            return 0.0
+        prompt_price, completion_price = prices
+        return (
+            self.prompt_tokens * prompt_price
+            + self.completion_tokens * completion_price
+        ) / 1_000_000
+
+
+type UsageListener = Callable[[UsageRecord], None]
+"""
+Callable notified about every completion request. Must not block.
+"""
+
+_listeners: list[UsageListener] = []
+
+_tags: ContextVar[tuple[int | None, int | None]] = ContextVar(
+    "usage_tags", default=(None, None)
+)
+
+
+def price_of(model: str) -> tuple[float, float] | None:
+    """
+    :param model: model name as returned by the provider
+    :return: USD per one million (prompt, completion) tokens, if known
+    """
+    # Longest prefix first, so "gpt-4o-mini-..." is not priced as "gpt-4o"
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return None
+
+
+@contextmanager
+def tagged(user_id: int | None, question_index: int | None = None) -> Iterator[None]:
+    """
+    Attributes completion requests made inside the block (and in tasks created
+    from it) to the given user and question.
+
+    :param user_id: identifier for the conversation participant
+    :param question_index: index of the question being discussed
+    """
+    token = _tags.set((user_id, question_index))
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def add_listener(listener: UsageListener) -> None:
+    """
+    Subscribes to usage records of all agents.
+
+    :param listener: callable receiving every UsageRecord
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener: UsageListener) -> None:
+    _listeners.remove(listener)
+
+
+def record(
+    agent: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency: float,
+) -> None:
+    """
+    Publishes usage of a completion request, tagged with the current user and question.
+    """
+    user_id, question_index = _tags.get()
+    usage_record = UsageRecord(
+        agent=agent,
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency=latency,
+        user_id=user_id,
+        question_index=question_index,
+    )
+    for listener in _listeners:
+        try:
+            listener(usage_record)
+        except Exception as e:
+            logger.error(f"Usage listener failed: {e}")
@@ -0,0 +1,89 @@
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+from src import types
+from src.utils.metrics import metrics
+
+from . import llm_scheduler
+from .info_extractor import UserInformation
+
+logger = logging.getLogger(__name__)
+
+type InfoUpdater = Callable[
+    [UserInformation | None, str, str], Awaitable[UserInformation]
+]
+"""
+Callable which merges one answered question into previously extracted information.
+Takes the previous information, question text and answer.
+"""
+
+
+class UserInfoTracker:
+    """
+    Keeps `UserInformation` of each user up to date while the dialog goes on,
+    so processors get it ready when the last question is answered.
+    """
+
+    def __init__(self, storage: types.UserInfoStorage, update: InfoUpdater) -> None:
+        """
+        :param storage: where the information is persisted
+        :param update: callable merging an answer into the information
+        """
+        self.storage = storage
+        self.update = update
+        # user_id → latest scheduled update; updates of a user run one after another
+        self._tails: dict[int, asyncio.Task] = {}
+
+    def track(self, user_id: int, question: str, answer: str) -> None:
+        """
+        Schedules an update with a newly answered question in the background.
+
+        :param user_id: identifier for the conversation participant
+        :param question: text of the answered question
+        :param answer: the user's answer
+        """
+        previous = self._tails.get(user_id)
+        task = asyncio.create_task(self._update(user_id, question, answer, previous))
+        self._tails[user_id] = task
+        task.add_done_callback(lambda _: self._forget(user_id, task))
+
+    async def wait(self, user_id: int) -> None:
+        """
+        Waits until all scheduled updates of the user are stored.
+
+        :param user_id: identifier for the conversation participant
+        """
+        task = self._tails.get(user_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def _update(
+        self,
+        user_id: int,
+        question: str,
+        answer: str,
+        previous: asyncio.Task | None,
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        try:
+            stored = await self.storage.get(user_id)
+            info, answered = None, 0
+            if stored is not None:
+                data, answered = stored
+                info = UserInformation.model_validate(data)
+
+            with llm_scheduler.priority(llm_scheduler.Priority.BACKGROUND):
+                info = await self.update(info, question, answer)
+            await self.storage.save(user_id, info.model_dump(mode="json"), answered + 1)
+        except Exception as e:
+            # The stored information now covers fewer answers than were given,
+            # so processors will extract it from scratch
+            metrics.increment("user_info.update_failures")
+            logger.error(f"Failed to update information of user {user_id}: {e}")
+
+    def _forget(self, user_id: int, task: asyncio.Task) -> None:
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
@@ -158,7 +158,9 @@ So, the explicilt requirement about repeating PSP name is redundant - user alrea
 
 
 validator = SimpleAgent(
+    name="validator",
     instructions=INSTRUCTIONS,
     expand_query=expand_query,
     output_type=ValidationResult,
+    deadline=60,
 )
@@ -2,10 +2,18 @@ from src.persistence.storages import (
     TortoiseUserAnswerStorage,
     TortoiseQuestionList,
     TortoiseContext,
+    TortoiseUserInfoStorage,
+    TortoiseMessageBuffer,
 )
+from src.persistence.ledger import LedgerWriter
+from src.persistence.invalidations import InvalidationBus
 
 __all__ = [
     "TortoiseUserAnswerStorage",
     "TortoiseQuestionList",
     "TortoiseContext",
+    "TortoiseUserInfoStorage",
+    "TortoiseMessageBuffer",
+    "LedgerWriter",
+    "InvalidationBus",
 ]
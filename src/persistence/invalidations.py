@@ -0,0 +1,173 @@
+"""
+Invalidation of state cached by worker processes which share the database.
+
+Every process caches what it reads on every message (instructions, chat
+progress, dialog contexts), so a change made by one process must be
+announced to the others. Changes are published as rows of
+`cache_invalidations`, and every process polls for the rows it has not seen
+yet, calling the listeners of the cache. Other processes thus see a change
+within `poll_interval`.
+"""
+
+from typing import Callable
+import asyncio
+import datetime
+import logging
+
+from tortoise import timezone
+
+from src.persistence import models
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INSTRUCTIONS = "instructions"
+"""
+Learned instructions, always invalidated as a whole.
+"""
+
+DIALOG_CONTEXTS = "dialog_contexts"
+"""
+Dialog contexts of a user, or of everyone if the supergroup changed.
+"""
+
+CHAT_STATE = "chat_state"
+"""
+Progress and conversation context of a user.
+"""
+
+type Listener = Callable[[int | None], None]
+"""
+Drops cached values, takes the user they belong to (None for everyone).
+"""
+
+
+class InvalidationBus:
+    """
+    Announces changes of cached state to the other worker processes.
+    Nothing is published until the bus is started, so a single process,
+    which has nobody to tell, pays nothing.
+    """
+
+    def __init__(
+        self,
+        origin: str,
+        poll_interval: float = 1.0,
+        retention: float = 3600.0,
+    ) -> None:
+        """
+        :param origin: identifier of this process, its own changes are not received
+        :param poll_interval: seconds between checks for changes made by others
+        :param retention: seconds after which published changes are deleted
+        """
+        self.origin = origin
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._listeners: dict[str, list[Listener]] = {}
+        self._last_id = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def subscribe(self, cache: str, listener: Listener) -> None:
+        """
+        :param cache: name of the cache, e.g. `INSTRUCTIONS`
+        :param listener: called for every change of the cache made by other processes
+        """
+        self._listeners.setdefault(cache, []).append(listener)
+
+    async def publish(self, cache: str, user_id: int | None = None) -> None:
+        """
+        Tells the other processes that the cache is outdated.
+        Must be called once the change is committed.
+
+        :param cache: name of the cache, e.g. `INSTRUCTIONS`
+        :param user_id: user whose values are outdated (None for everyone)
+        """
+        if self._task is None:
+            return
+        try:
+            await models.CacheInvalidation.create(
+                cache=cache, user_id=user_id, origin=self.origin
+            )
+        except Exception as e:
+            # The change itself is made, failing here would only hide that
+            logger.error(f"Failed to publish invalidation of {cache}: {e}")
+            return
+        metrics.increment("invalidations.published")
+
+    async def start(self) -> None:
+        """
+        Starts receiving the changes published from now on.
+        """
+        if self._task is not None:
+            return
+        last_id = (
+            await models.CacheInvalidation.all()
+            .order_by("-id")
+            .first()
+            .values_list("id", flat=True)
+        )
+        self._last_id = last_id or 0
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def poll(self) -> None:
+        """
+        Calls the listeners of the changes published since the last poll.
+        """
+        rows = (
+            await models.CacheInvalidation.filter(id__gt=self._last_id)
+            .order_by("id")
+            .values_list("id", "cache", "user_id", "origin")
+        )
+        for id_, cache, user_id, origin in rows:
+            self._last_id = id_
+            if origin == self.origin:
+                continue
+            metrics.increment("invalidations.received")
+            for listener in self._listeners.get(cache, []):
+                listener(user_id)
+
+    async def _run(self) -> None:
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+                polls += 1
+                # Every process prunes, rarely enough not to matter
+                if polls * self.poll_interval >= self.retention / 10:
+                    polls = 0
+                    await self._prune()
+            except Exception as e:
+                logger.error(f"Failed to poll cache invalidations: {e}")
+
+    async def _prune(self) -> None:
+        expired_at = timezone.now() - datetime.timedelta(seconds=self.retention)
+        await models.CacheInvalidation.filter(created_at__lt=expired_at).delete()
+
+
+_bus = InvalidationBus(origin="")
+
+
+def configure(bus: InvalidationBus) -> None:
+    """
+    Replaces the process-wide bus. Should be called once at startup.
+    """
+    global _bus
+    _bus = bus
+
+
+def get_bus() -> InvalidationBus:
+    """
+    :return: the process-wide bus (not started with a single process)
+    """
+    return _bus
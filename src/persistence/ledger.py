@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import logging
+
+from tortoise import connections
+from tortoise.expressions import RawSQL
+from tortoise.functions import Avg, Count, Sum
+
+from src.chat.usage import UsageRecord
+from src.persistence import models
+
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerWriter:
+    """
+    Persists usage records in batches, so accounting adds no
+    database round trips to the reply path.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0) -> None:
+        """
+        :param batch_size: maximum number of records inserted at once
+        :param flush_interval: seconds a record may wait before it is written
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # None asks the running writer to flush its batch and stop
+        self._queue: asyncio.Queue[UsageRecord | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def submit(self, record: UsageRecord) -> None:
+        """
+        Queues a record for writing. Can be used as a usage listener.
+
+        :param record: usage of a single completion request
+        """
+        self._queue.put_nowait(record)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """
+        Stops the writer and flushes the records queued so far.
+        """
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            await self._write(self._take(self.batch_size))
+
+    async def _run(self) -> None:
+        while True:
+            record = await self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            loop = asyncio.get_running_loop()
+            flush_at = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = await asyncio.wait_for(
+                        self._queue.get(), flush_at - loop.time()
+                    )
+                except TimeoutError:
+                    break
+                if record is None:
+                    await self._write(batch)
+                    return
+                batch.append(record)
+            await self._write(batch)
+
+    def _take(self, limit: int) -> list[UsageRecord]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: list[UsageRecord]) -> None:
+        try:
+            await models.LlmCall.bulk_create(
+                [
+                    models.LlmCall(
+                        agent=record.agent,
+                        model=record.model,
+                        user_id=record.user_id,
+                        question_index=record.question_index,
+                        prompt_tokens=record.prompt_tokens,
+                        completion_tokens=record.completion_tokens,
+                        cost=record.cost,
+                        latency=record.latency,
+                        created_at=record.created_at,
+                    )
+                    for record in batch
+                ]
+            )
+        except Exception as e:
+            # Accounting must never break the bot
+            logger.error(f"Failed to write {len(batch)} usage records: {e}")
+
+
+def _totals(query):
+    return query.annotate(
+        calls=Count("id"),
+        prompt_tokens_sum=Sum("prompt_tokens"),
+        completion_tokens_sum=Sum("completion_tokens"),
+        cost_sum=Sum("cost"),
+        latency_avg=Avg("latency"),
+    )
+
+
+_TOTAL_FIELDS = (
+    "calls",
+    "prompt_tokens_sum",
+    "completion_tokens_sum",
+    "cost_sum",
+    "latency_avg",
+)
+
+
+async def usage_by_agent(since: datetime.datetime) -> list[dict]:
+    """
+    :param since: only calls made after this moment are counted
+    :return: call count, token sums, cost and mean latency per agent
+    """
+    query = models.LlmCall.filter(created_at__gte=since)
+    return (
+        await _totals(query)
+        .group_by("agent")
+        .order_by("-cost_sum")
+        .values("agent", *_TOTAL_FIELDS)
+    )
+
+
+async def usage_by_question(since: datetime.datetime) -> list[dict]:
+    """
+    :param since: only calls made after this moment are counted
+    :return: the same totals as `usage_by_agent`, per question index
+    """
+    query = models.LlmCall.filter(
+        created_at__gte=since, question_index__not_isnull=True
+    )
+    return (
+        await _totals(query)
+        .group_by("question_index")
+        .order_by("question_index")
+        .values("question_index", *_TOTAL_FIELDS)
+    )
+
+
+def _utc_day() -> RawSQL:
+    # Date truncation is not portable between backends
+    if connections.get("default").capabilities.dialect == "postgres":
+        return RawSQL("(created_at AT TIME ZONE 'UTC')::date")
+    # SQLite stores UTC offsets with the value and converts to UTC
+    return RawSQL("date(created_at)")
+
+
+async def usage_by_day(since: datetime.datetime) -> list[dict]:
+    """
+    :param since: only calls made after this moment are counted
+    :return: call count, token sums and cost per calendar day (UTC)
+    """
+    rows = (
+        await models.LlmCall.filter(created_at__gte=since)
+        .annotate(
+            day=_utc_day(),
+            calls=Count("id"),
+            prompt_tokens_sum=Sum("prompt_tokens"),
+            completion_tokens_sum=Sum("completion_tokens"),
+            cost_sum=Sum("cost"),
+        )
+        .group_by("day")
+        .order_by("day")
+        .values(
+            "day", "calls", "prompt_tokens_sum", "completion_tokens_sum", "cost_sum"
+        )
+    )
+    for row in rows:
+        # SQLite returns dates as text
+        if isinstance(row["day"], str):
+            row["day"] = datetime.date.fromisoformat(row["day"])
+    return rows
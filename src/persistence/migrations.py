@@ -0,0 +1,85 @@
+"""
+Schema changes which `generate_schemas` cannot make on existing databases,
+e.g. new columns of existing tables. Every migration runs once and is
+recorded in the `schema_migrations` table.
+"""
+
+from typing import Awaitable, Callable
+import logging
+
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+from src.persistence import models
+
+logger = logging.getLogger(__name__)
+
+type Migration = Callable[[BaseDBAsyncClient], Awaitable[None]]
+
+
+async def _has_column(connection: BaseDBAsyncClient, table: str, column: str) -> bool:
+    try:
+        await connection.execute_query(f"SELECT {column} FROM {table} LIMIT 0")
+    except OperationalError:
+        return False
+    return True
+
+
+async def add_user_progress_pointer(connection: BaseDBAsyncClient) -> None:
+    # Checked outside the transaction: a failed statement aborts it on PostgreSQL
+    has_column = await _has_column(connection, "users", "current_question_index")
+    async with in_transaction(connection.connection_name) as tx:
+        if not has_column:
+            await tx.execute_script(
+                "ALTER TABLE users "
+                "ADD COLUMN current_question_index INT NOT NULL DEFAULT 0"
+            )
+        await tx.execute_script(
+            "UPDATE users SET current_question_index = "
+            "(SELECT COUNT(*) FROM qa_entries WHERE qa_entries.user_id = users.id)"
+        )
+
+
+async def split_partial_answers(connection: BaseDBAsyncClient) -> None:
+    # Checked outside the transaction: a failed statement aborts it on PostgreSQL
+    if not await _has_column(connection, "partial_answers", "content"):
+        return
+    # The table of segments is created by `generate_schemas`;
+    # every stored answer becomes its first segment
+    async with in_transaction(connection.connection_name) as tx:
+        await tx.execute_script(
+            "INSERT INTO partial_answer_segments (user_id, content) "
+            "SELECT user_id, content FROM partial_answers ORDER BY id"
+        )
+        await tx.execute_script("DROP TABLE partial_answers")
+
+
+MIGRATIONS: list[tuple[str, Migration]] = [
+    ("0001_user_progress_pointer", add_user_progress_pointer),
+    ("0002_partial_answer_segments", split_partial_answers),
+]
+
+
+async def migrate(connection_name: str = "default") -> None:
+    """
+    Applies migrations which were not applied yet. Must be called after
+    `generate_schemas`, which creates the tables of a fresh database.
+    Every migration must be safe to rerun, in case it was interrupted
+    before being recorded.
+
+    :param connection_name: Tortoise connection to migrate
+    """
+    connection = connections.get(connection_name)
+    applied = set(
+        await models.SchemaMigration.all()
+        .using_db(connection)
+        .values_list("name", flat=True)
+    )
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        logger.info(f"Applying migration {name}")
+        await migration(connection)
+        await models.SchemaMigration.create(name=name, using_db=connection)
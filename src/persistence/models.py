@@ -7,6 +7,8 @@ class User(Model):
     name = fields.TextField()
     url = fields.TextField()
     is_onboarding_completed = fields.BooleanField(default=False)
+    # Index of the next question to answer, kept in sync with qa_entries
+    current_question_index = fields.IntField(default=0)
     sent_messages_count = fields.IntField(default=0)
     started_at = fields.DatetimeField(auto_now_add=True)
 
@@ -14,16 +16,21 @@ class User(Model):
         table = "users"
 
 
-class PartialAnswer(Model):
+class PartialAnswerSegment(Model):
+    """
+    One turn of the conversation about the current question.
+    Segments are only appended, the partial answer is all of them in `id` order.
+    """
+
     id = fields.IntField(pk=True)
     user = fields.ForeignKeyField(
-        "models.User", related_name="partial", on_delete=fields.CASCADE
+        "models.User", related_name="partial_segments", on_delete=fields.CASCADE
     )
     content = fields.TextField()
 
     class Meta:
-        table = "partial_answers"
-        indexes = [("user",)]
+        table = "partial_answer_segments"
+        indexes = [("user", "id")]
 
 
 class QAEntry(Model):
@@ -41,6 +48,19 @@ class QAEntry(Model):
         indexes = [("user", "question_index")]
 
 
+class UserInfo(Model):
+    id = fields.IntField(pk=True)
+    user = fields.OneToOneField(
+        "models.User", related_name="info", on_delete=fields.CASCADE
+    )
+    data = fields.JSONField()
+    answered = fields.IntField()
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "user_info"
+
+
 class SuperGroup(Model):
     id = fields.IntField(pk=True)
     group_id = fields.BigIntField(
@@ -89,3 +109,75 @@ class Context(Model):
 
     class Meta:
         table = "context"
+
+
+class LlmCall(Model):
+    id = fields.IntField(pk=True)
+    agent = fields.CharField(max_length=64)
+    model = fields.CharField(max_length=128)
+    # Not a foreign key: calls are also made for users absent in the database
+    user_id = fields.BigIntField(null=True)
+    question_index = fields.IntField(null=True)
+    prompt_tokens = fields.IntField()
+    completion_tokens = fields.IntField()
+    cost = fields.FloatField()
+    latency = fields.FloatField()
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "llm_calls"
+        indexes = [("created_at",), ("agent",), ("user_id",)]
+
+
+class BufferedMessage(Model):
+    id = fields.IntField(pk=True)
+    # Not a foreign key: kept only until the bot replies to it
+    user_id = fields.BigIntField()
+    chat_id = fields.BigIntField()
+    message_id = fields.BigIntField()
+    text = fields.TextField()
+    received_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "buffered_messages"
+        indexes = [("user_id", "id")]
+
+
+class BufferLease(Model):
+    """
+    Which worker replies to the buffered messages of a user.
+    Rows are kept after release, so the next owner knows who replied last.
+    """
+
+    user_id = fields.BigIntField(pk=True)
+    owner = fields.CharField(max_length=255)
+    expires_at = fields.DatetimeField()
+
+    class Meta:
+        table = "buffer_leases"
+
+
+class CacheInvalidation(Model):
+    """
+    Change made by one worker process to state which the others cache.
+    Rows are only kept until every process has seen them.
+    """
+
+    id = fields.IntField(pk=True)
+    cache = fields.CharField(max_length=64)
+    # None if the whole cache is outdated
+    user_id = fields.BigIntField(null=True)
+    origin = fields.CharField(max_length=255)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "cache_invalidations"
+        indexes = [("created_at",)]
+
+
+class SchemaMigration(Model):
+    name = fields.CharField(max_length=255, pk=True)
+    applied_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "schema_migrations"
@@ -1,73 +1,122 @@
+import datetime
+
+from tortoise import exceptions, timezone
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
 from src.persistence import models
 from src import types
 
 
 class TortoiseUserAnswerStorage(types.UserAnswerStorage):
+    # We do not check if the user exists, because
+    # it must exist by the time we call these methods
+
     async def append(self, user_id: int, partial_answer: str) -> None:
-        # We do not check if the user exists, because
-        # it must exist by the time we call this method
-        user = await models.User.filter(id=user_id).first()
-        existing = await models.PartialAnswer.filter(user=user).first()
-        if existing:
-            existing.content += f"{partial_answer}"
-            await existing.save()
-        else:
-            await models.PartialAnswer.create(user=user, content=partial_answer)
+        # A new segment instead of rewriting the whole answer on every turn
+        await models.PartialAnswerSegment.create(
+            user_id=user_id, content=partial_answer
+        )
 
     async def get(self, user_id: int) -> str | None:
-        # We do not check if the user exists, because
-        # it must exist by the time we call this method
-        user = await models.User.filter(id=user_id).first()
-        entry = await models.PartialAnswer.filter(user=user).first()
-        return entry.content if entry else None
+        segments = (
+            await models.PartialAnswerSegment.filter(user_id=user_id)
+            .order_by("id")
+            .values_list("content", flat=True)
+        )
+        return "".join(segments) if segments else None
 
     async def clear(self, user_id: int) -> None:
-        await models.PartialAnswer.filter(user_id=user_id).delete()
+        await models.PartialAnswerSegment.filter(user_id=user_id).delete()
 
     async def replace(self, user_id: int, new_answer: str) -> None:
-        user = await models.User.filter(id=user_id).first()
-        existing = await models.PartialAnswer.filter(user=user).first()
-        if existing:
-            existing.content = new_answer
-            await existing.save()
-        else:
-            await models.PartialAnswer.create(user=user, content=new_answer)
+        async with in_transaction():
+            await models.PartialAnswerSegment.filter(user_id=user_id).delete()
+            await models.PartialAnswerSegment.create(
+                user_id=user_id, content=new_answer
+            )
+
+    async def segments(self, user_id: int) -> list[tuple[int, str]]:
+        return (
+            await models.PartialAnswerSegment.filter(user_id=user_id)
+            .order_by("id")
+            .values_list("id", "content")
+        )
+
+    async def replace_up_to(
+        self, user_id: int, segment_id: int, new_answer: str
+    ) -> bool:
+        async with in_transaction():
+            # The last replaced segment takes the new text, so it keeps its place
+            # before the segments appended later
+            updated = await models.PartialAnswerSegment.filter(
+                user_id=user_id, id=segment_id
+            ).update(content=new_answer)
+            if not updated:
+                return False
+            await models.PartialAnswerSegment.filter(
+                user_id=user_id, id__lt=segment_id
+            ).delete()
+        return True
 
 
 class TortoiseQuestionList(types.QuestionList):
     def __init__(self, questions: list[types.Question]):
         self.questions = questions
 
+    async def _progress(self, user_id: int) -> tuple[int, bool] | None:
+        """
+        :return: index of the current question and whether the user was stopped
+            (None if the user is not registered)
+        """
+        return (
+            await models.User.filter(id=user_id)
+            .first()
+            .values_list("current_question_index", "is_onboarding_completed")
+        )
+
     async def has_user_started(self, user_id: int) -> bool:
-        return await models.QAEntry.filter(user_id=user_id).exists()
+        return await models.User.filter(
+            id=user_id, current_question_index__gt=0
+        ).exists()
 
     async def current_question(self, user_id: int) -> types.Question | None:
-        if not await models.User.filter(id=user_id).exists():
-            return self.questions[0] if self.questions else None
+        index = await self.current_question_index(user_id)
+        return self.questions[index] if index is not None else None
 
-        answered = await models.QAEntry.filter(user_id=user_id).count()
-        if answered >= len(self.questions):
-            return None
-        return self.questions[answered]
+    async def current_question_index(self, user_id: int) -> int | None:
+        progress = await self._progress(user_id)
+        index = progress[0] if progress else 0
+        return index if index < len(self.questions) else None
+
+    async def remaining_questions(self, user_id: int) -> list[types.Question]:
+        progress = await self._progress(user_id)
+        return self.questions[progress[0] if progress else 0 :]
 
     async def advance(self, user_id: int, answer: str) -> None:
         # We do not check if the user exists, because
         # it must exist by the time we call this method
-        user = await models.User.filter(id=user_id).first()
-        answered = await models.QAEntry.filter(user=user).count()
-        if answered < len(self.questions):
-            q = self.questions[answered]
-            await models.QAEntry.create(
-                user=user,
-                question_index=answered,
-                question_text=q.text,
-                answer=answer,
+        async with in_transaction():
+            answered = (
+                await models.User.filter(id=user_id)
+                .first()
+                .values_list("current_question_index", flat=True)
             )
+            if answered < len(self.questions):
+                q = self.questions[answered]
+                await models.QAEntry.create(
+                    user_id=user_id,
+                    question_index=answered,
+                    question_text=q.text,
+                    answer=answer,
+                )
+                await models.User.filter(id=user_id).update(
+                    current_question_index=answered + 1
+                )
 
     async def all_finished(self, user_id: int) -> bool:
-        user = await models.User.filter(id=user_id).first()
-        count = await models.QAEntry.filter(user_id=user_id).count()
-        return count >= len(self.questions) or user.is_onboarding_completed
+        answered, is_onboarding_completed = await self._progress(user_id)
+        return answered >= len(self.questions) or is_onboarding_completed
 
     async def qa_pairs(self, user_id: int) -> list[types.QaPair]:
         # We do not check if the user exists, because
@@ -93,9 +142,7 @@ class TortoiseQuestionList(types.QuestionList):
         return pairs
 
     async def stop_talking_with(self, user_id: int) -> None:
-        user = await models.User.filter(id=user_id).first()
-        user.is_onboarding_completed = True
-        await user.save()
+        await models.User.filter(id=user_id).update(is_onboarding_completed=True)
 
 
 class TortoiseContext(types.Context):
@@ -110,3 +157,80 @@ class TortoiseContext(types.Context):
 
     async def clear(self) -> None:
         await models.Context.all().delete()
+
+    async def replace(self, information: str) -> None:
+        async with in_transaction():
+            await models.Context.all().delete()
+            await models.Context.create(context=information)
+
+
+class TortoiseUserInfoStorage(types.UserInfoStorage):
+    async def get(self, user_id: int) -> tuple[dict, int] | None:
+        entry = await models.UserInfo.filter(user_id=user_id).first()
+        return (entry.data, entry.answered) if entry else None
+
+    async def save(self, user_id: int, info: dict, answered: int) -> None:
+        await models.UserInfo.update_or_create(
+            defaults={"data": info, "answered": answered},
+            user_id=user_id,
+        )
+
+
+class TortoiseMessageBuffer(types.MessageBuffer):
+    async def push(
+        self, user_id: int, chat_id: int, message_id: int, text: str
+    ) -> None:
+        await models.BufferedMessage.create(
+            user_id=user_id, chat_id=chat_id, message_id=message_id, text=text
+        )
+
+    async def pending(self, user_id: int) -> list[types.PendingMessage]:
+        rows = (
+            await models.BufferedMessage.filter(user_id=user_id)
+            .order_by("id")
+            .values_list("id", "chat_id", "message_id", "text", "received_at")
+        )
+        return [types.PendingMessage(*row) for row in rows]
+
+    async def remove(self, user_id: int, up_to_id: int) -> None:
+        await models.BufferedMessage.filter(user_id=user_id, id__lte=up_to_id).delete()
+
+    async def users_with_pending(self) -> list[int]:
+        return (
+            await models.BufferedMessage.all()
+            .distinct()
+            .values_list("user_id", flat=True)
+        )
+
+    async def acquire(
+        self, user_id: int, owner: str, ttl: float
+    ) -> tuple[bool, str | None]:
+        now = timezone.now()
+        expires_at = now + datetime.timedelta(seconds=ttl)
+        lease = await models.BufferLease.filter(user_id=user_id).first()
+        if lease is None:
+            try:
+                await models.BufferLease.create(
+                    user_id=user_id, owner=owner, expires_at=expires_at
+                )
+            except exceptions.IntegrityError:
+                # Another worker created it first
+                return False, None
+            return True, None
+
+        # Conditional on the row read above: of concurrent workers, only one updates it
+        taken = (
+            await models.BufferLease.filter(
+                Q(owner=owner) | Q(expires_at__lte=now),
+                user_id=user_id,
+                owner=lease.owner,
+                expires_at=lease.expires_at,
+            ).update(owner=owner, expires_at=expires_at)
+            == 1
+        )
+        return taken, lease.owner
+
+    async def release(self, user_id: int, owner: str) -> None:
+        await models.BufferLease.filter(user_id=user_id, owner=owner).update(
+            expires_at=timezone.now()
+        )
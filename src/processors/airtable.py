@@ -1,7 +1,6 @@
 import pyairtable
 
 from src import types
-from src.chat import info_extractor
 from src.persistence import models
 from src.processors import utils
 
@@ -19,6 +18,6 @@ class AirtableProcessor:
         user_name = user.name
         tg = user.url
         started_at = user.started_at
-        user_info = await info_extractor.extract_info(qa_pairs)
+        user_info = await utils.load_user_info(user_id, qa_pairs)
         row = utils.flatten_user_info(user_name, tg, user_info, started_at)
         self.table.create(row)
@@ -4,7 +4,6 @@ import pathlib
 import openpyxl
 
 from src import types
-from src.chat import info_extractor
 from src.persistence import models
 from src.processors import utils
 
@@ -27,7 +26,7 @@ class ExcelProcessor:
         tg = user.url
 
         # Extract and flatten the information
-        user_info = await info_extractor.extract_info(qa_pairs)
+        user_info = await utils.load_user_info(user_id, qa_pairs)
         row = utils.flatten_user_info(user_name, tg, user_info)
 
         # Load existing workbook or create a new one
@@ -1,7 +1,6 @@
 import gspread
 from google.oauth2.service_account import Credentials
 
-from src.chat.info_extractor import extract_info
 from src.persistence.models import User
 from src import types
 from src.processors import utils
@@ -58,7 +57,7 @@ class GoogleSheetsProcessor:
         """
         user_name = (await User.filter(id=user_id).first()).name
         tg = (await User.filter(id=user_id).first()).url
-        user_info = await extract_info(qa_pairs)
+        user_info = await utils.load_user_info(user_id, qa_pairs)
 
         # Open the sheet by URL
         sheet = self.client.open_by_url(self.sheet_url)
@@ -1,6 +1,8 @@
 import datetime
 
+from src import types
 from src.chat import info_extractor
+from src.persistence import TortoiseUserInfoStorage
 
 
 def flatten_user_info(
@@ -50,3 +52,30 @@ def flatten_user_info(
         "created_at": datetime.date.today().isoformat(),
         "user_started_at": started_at.date().isoformat(),
     }
+
+
+async def load_user_info(
+    user_id: int, qa_pairs: list[types.QaPair]
+) -> info_extractor.UserInformation:
+    """Return information extracted from the user's answers.
+
+    Uses the information collected during the dialog if it covers every answer,
+    otherwise extracts it from scratch and stores it, so later exports are free.
+
+    Args:
+        user_id: The ID of the user
+        qa_pairs: All question-answer pairs of the user
+
+    Returns:
+        UserInformation object containing all user data
+    """
+    storage = TortoiseUserInfoStorage()
+    stored = await storage.get(user_id)
+    if stored is not None:
+        data, answered = stored
+        if answered >= len(qa_pairs):
+            return info_extractor.UserInformation.model_validate(data)
+
+    user_info = await info_extractor.extract_info(qa_pairs)
+    await storage.save(user_id, user_info.model_dump(mode="json"), len(qa_pairs))
+    return user_info
@@ -1,22 +1,71 @@
+import asyncio
+import functools
 import logging
+import multiprocessing
 import pathlib
 
 from aiogram import Bot, Dispatcher
+from tortoise.transactions import in_transaction
 
 from src import persistence
-from src.utils.config import load_config
+from src.persistence import invalidations
+from src.utils import db_queries
+from src.utils.config import Config, load_config
 
 from src import processors
 
 from src import chat
+from src.chat import client_pool, llm_scheduler, response_cache, usage
 from src.tg_bot.handlers import supergroup, chat_flow
 from src.tg_bot import middlewares
 from src.tg_bot import chat_settings
 from src.tg_bot import tortoise_config
+from src.tg_bot import buffering
+from src.tg_bot import webhook
 
 
-async def run_bot():
+def _webhook_settings(config: Config) -> webhook.WebhookSettings | None:
+    if config.bot_mode == "polling":
+        return None
+    if config.bot_mode != "webhook":
+        raise RuntimeError(
+            f"Unknown BOT_MODE {config.bot_mode!r}, expected 'polling' or 'webhook'"
+        )
+    if not config.webhook_url or not config.webhook_secret:
+        raise RuntimeError("Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET")
+    return webhook.WebhookSettings(
+        url=config.webhook_url,
+        secret_token=config.webhook_secret,
+        path=config.webhook_path,
+        host=config.webhook_host,
+        port=config.webhook_port,
+        workers=config.webhook_workers,
+    )
+
+
+def _run_worker() -> None:
+    asyncio.run(run_bot(primary=False))
+
+
+def _start_workers(count: int) -> list[multiprocessing.Process]:
+    # Spawned rather than forked: the event loop and connections of this process must not be shared
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_run_worker, name=f"webhook-worker-{i}")
+        for i in range(1, count + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+async def run_bot(primary: bool = True):
+    """
+    :param primary: False in additional webhook workers, which only serve updates
+        (the primary process registers the webhook and starts them)
+    """
     config = load_config()
+    webhook_settings = _webhook_settings(config)
 
     log_file_path = pathlib.Path(config.data_dir) / config.log_file
     logging.basicConfig(
@@ -28,6 +77,36 @@ async def run_bot():
         ],
     )
 
+    client_pool.configure(
+        client_pool.ClientPoolSettings(
+            max_connections=config.openai_max_connections,
+            max_keepalive_connections=config.openai_max_keepalive_connections,
+            keepalive_expiry=config.openai_keepalive_expiry,
+            timeout=config.openai_timeout,
+        )
+    )
+    llm_scheduler.configure(
+        requests_per_minute=config.openai_requests_per_minute or None,
+        tokens_per_minute=config.openai_tokens_per_minute or None,
+    )
+    response_cache.configure(
+        response_cache.ResponseCacheSettings(
+            enabled=config.response_cache_enabled,
+            memory_size=config.response_cache_size,
+            sqlite_path=str(pathlib.Path(config.data_dir) / config.response_cache_file),
+            sqlite_ttl=config.response_cache_ttl,
+        )
+    )
+
+    buffering.configure(
+        buffering.DebouncePolicy(
+            min_quiet=config.debounce_min_quiet,
+            max_quiet=config.debounce_max_quiet,
+            max_wait=config.debounce_max_wait,
+            idle_timeout=config.buffer_idle_timeout,
+        )
+    )
+
     airtable_processor = processors.AirtableProcessor(
         access_token=config.airtable_access_token,
         base_id=config.airtable_base_id,
@@ -44,16 +123,43 @@ async def run_bot():
         table_id=config.airtable_table_id_users_count,
     )
 
+    response_generators = {
+        "multi": functools.partial(
+            chat.generate_response,
+            speculative=config.speculative_routing,
+        ),
+        "fused": chat.generate_fused_response,
+    }
     chat_manager = chat.ChatManager(
-        question_list=persistence.TortoiseQuestionList(chat_settings.QUESTIONS),
-        user_answer_storage=persistence.TortoiseUserAnswerStorage(),
-        context=persistence.TortoiseContext(),
-        generate_response=chat.generate_response,
+        question_list=chat.CachedQuestionList(
+            persistence.TortoiseQuestionList(chat_settings.QUESTIONS)
+        ),
+        user_answer_storage=chat.CachedUserAnswerStorage(
+            persistence.TortoiseUserAnswerStorage()
+        ),
+        context=chat.CachedContext(persistence.TortoiseContext()),
+        user_info_storage=persistence.TortoiseUserInfoStorage(),
+        transaction=in_transaction,
+        generate_response=response_generators["multi"],
         generate_reply=chat.generate_reply,
         on_all_finished=[
             airtable_processor,
         ],
+        response_generators=response_generators,
+        context_budget=chat.ContextBudget(
+            max_tokens=config.context_max_tokens,
+            keep_turns=config.context_keep_turns,
+        )
+        if config.context_max_tokens
+        else None,
+        summarize_context=chat.summarize_text,
+        merge_instructions=chat.merge_instructions,
+        instructions_max_tokens=config.instructions_max_tokens or None,
+        extract_answers=chat.extract_answers
+        if config.multi_question_extraction
+        else None,
     )
+    chat_manager.select_response_generator(config.response_pipeline)
 
     bot = Bot(token=config.bot_token)
     dp = Dispatcher()
@@ -70,9 +176,67 @@ async def run_bot():
     )
     dp.include_routers(supergroup.router, chat_flow.router)
 
-    db_url = f"sqlite://{pathlib.Path(config.data_dir) / config.db_file}"
-    await tortoise_config.init_db(db_url, ["src.persistence.models"])
+    db_url = (
+        config.database_url
+        or f"sqlite://{pathlib.Path(config.data_dir) / config.db_file}"
+    )
+    await tortoise_config.init_db(
+        db_url,
+        ["src.persistence.models"],
+        pool_min_size=config.database_pool_min_size,
+        pool_max_size=config.database_pool_max_size,
+    )
+    db_queries.install()
+
+    bus = invalidations.get_bus()
+    if webhook_settings is not None and webhook_settings.workers > 1:
+        # Workers cache what they read, each tells the others what it changed
+        bus = invalidations.InvalidationBus(
+            origin=chat_flow.WORKER_ID,
+            poll_interval=config.cache_invalidation_interval,
+        )
+        invalidations.configure(bus)
+        bus.subscribe(
+            invalidations.INSTRUCTIONS, lambda _: chat_manager.context.invalidate()
+        )
+        bus.subscribe(
+            invalidations.DIALOG_CONTEXTS, middlewares.dialog_contexts.invalidate
+        )
+        bus.subscribe(invalidations.CHAT_STATE, chat_manager.invalidate_cached_state)
+        # The dialog context counts the messages mirrored into the topic
+        bus.subscribe(invalidations.CHAT_STATE, middlewares.dialog_contexts.invalidate)
+        await bus.start()
+
+    ledger = persistence.LedgerWriter()
+    ledger.start()
+    usage.add_listener(ledger.submit)
 
-    await bot.set_my_description("Hi! To start the conversation, use /start command.")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    workers: list[multiprocessing.Process] = []
+    try:
+        if primary:
+            await bot.set_my_description(
+                "Hi! To start the conversation, use /start command."
+            )
+        if webhook_settings is None:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await chat_flow.recover(bot, chat_manager)
+            await dp.start_polling(bot)
+        else:
+            if primary:
+                await chat_flow.recover(bot, chat_manager)
+                await webhook.register(dp, bot, webhook_settings)
+                workers = _start_workers(webhook_settings.workers - 1)
+            await webhook.serve(dp, bot, webhook_settings)
+    finally:
+        # Messages buffered by the workers are answered after the next start
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        await bus.close()
+        await chat_flow.flush_scheduler.close()
+        await llm_scheduler.get_scheduler().close()
+        usage.remove_listener(ledger.submit)
+        await ledger.close()
+        await client_pool.close_all()
+        await response_cache.get_cache().close()
@@ -0,0 +1,338 @@
+"""
+Batching of messages a user sends in quick succession.
+
+Users often split one answer into several messages, so the bot waits
+until the user stops typing before replying to all of them at once.
+"""
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+import asyncio
+import heapq
+import logging
+import time
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class DebouncePolicy:
+    """
+    How long to wait for more messages before replying.
+
+    The quiet window follows the user's typing cadence: `gap_factor` times
+    the smoothed gap between their messages, clamped to `[min_quiet, max_quiet]`.
+    """
+
+    min_quiet: float = 2.0
+    """
+    Shortest wait after the last message, in seconds.
+    """
+
+    max_quiet: float = 15.0
+    """
+    Longest wait after the last message, in seconds.
+    """
+
+    initial_quiet: float = 5.0
+    """
+    Wait after the last message until the user's cadence is known.
+    """
+
+    max_wait: float = 30.0
+    """
+    Upper bound of the wait after the first message of a batch,
+    so a user who keeps typing still gets a reply.
+    """
+
+    gap_factor: float = 2.0
+    """
+    Quiet window relative to the typical gap between messages.
+    """
+
+    smoothing: float = 0.3
+    """
+    Weight of the latest gap in the moving average of gaps.
+    """
+
+    max_gap: float = 60.0
+    """
+    Longer gaps start a new conversation burst and do not change the cadence.
+    """
+
+    idle_timeout: float = 3600.0
+    """
+    Inactivity after which everything kept for the user is dropped.
+    """
+
+    failure_backoff: float = 1.0
+    """
+    Wait before retrying a failed flush, doubled with every consecutive failure.
+    """
+
+    max_failure_backoff: float = 60.0
+    """
+    Longest wait before retrying a failed flush.
+    """
+
+    max_failures: int = 5
+    """
+    Consecutive failed flushes after which the user is dropped.
+    """
+
+    def failure_delay(self, failures: int) -> float:
+        """
+        :param failures: consecutive failed flushes, at least 1
+        :return: how long to wait before the next attempt
+        """
+        return min(self.failure_backoff * 2 ** (failures - 1), self.max_failure_backoff)
+
+    def quiet_window(self, cadence: float | None) -> float:
+        """
+        :param cadence: smoothed gap between the user's messages (None if unknown)
+        :return: how long to wait after the last message
+        """
+        if cadence is None:
+            return self.initial_quiet
+        return min(max(cadence * self.gap_factor, self.min_quiet), self.max_quiet)
+
+
+_policy = DebouncePolicy()
+
+
+def configure(policy: DebouncePolicy) -> None:
+    """
+    Replaces the process-wide policy. Should be called once at startup.
+    """
+    global _policy
+    _policy = policy
+
+
+def get_policy() -> DebouncePolicy:
+    """
+    :return: the process-wide policy
+    """
+    return _policy
+
+
+class Debouncer:
+    """
+    Tracks the typing cadence of one user and tells when
+    the buffered messages are due to be answered.
+    """
+
+    def __init__(self, policy: DebouncePolicy | None = None) -> None:
+        """
+        :param policy: wait limits (the process-wide policy if None)
+        """
+        self.policy = policy or get_policy()
+        self.cadence: float | None = None
+        self.last_message_at: float | None = None
+        # Start of the batch which is not answered yet
+        self.first_message_at: float | None = None
+        self.not_before = 0.0
+
+    def message_arrived(self) -> None:
+        now = time.monotonic()
+        if self.last_message_at is not None:
+            gap = now - self.last_message_at
+            if gap <= self.policy.max_gap:
+                if self.cadence is None:
+                    self.cadence = gap
+                else:
+                    alpha = self.policy.smoothing
+                    self.cadence = alpha * gap + (1 - alpha) * self.cadence
+        self.last_message_at = now
+        if self.first_message_at is None:
+            self.first_message_at = now
+
+    def deadline(self) -> float | None:
+        """
+        :return: monotonic time the batch is answered at (None if nothing is buffered)
+        """
+        if self.first_message_at is None:
+            return None
+        deadline = min(
+            self.last_message_at + self.policy.quiet_window(self.cadence),
+            self.first_message_at + self.policy.max_wait,
+        )
+        return max(deadline, self.not_before)
+
+    def overdue(self) -> bool:
+        """
+        :return: whether the unanswered batch has waited `max_wait` already
+        """
+        if self.first_message_at is None:
+            return False
+        return time.monotonic() >= self.first_message_at + self.policy.max_wait
+
+    def postpone(self, delay: float) -> None:
+        """
+        Moves the deadline at least `delay` seconds away, e.g. while
+        another worker is replying to the user.
+        """
+        self.not_before = time.monotonic() + delay
+
+    def batch_done(self, answered_until: float | None = None) -> None:
+        """
+        Must be called once the buffered messages are answered.
+
+        :param answered_until: `last_message_at` of the answered messages;
+            later ones start a new batch (everything is answered if None)
+        """
+        if answered_until is not None and self.last_message_at > answered_until:
+            # Only the latest of the unanswered messages is known
+            self.first_message_at = self.last_message_at
+        else:
+            self.first_message_at = None
+        self.not_before = 0.0
+
+
+class FlushScheduler:
+    """
+    Single timer for all users: fires a flush once a user's batch is due
+    and drops users who have been idle for `DebouncePolicy.idle_timeout`.
+
+    A failed flush is retried after `DebouncePolicy.failure_delay`,
+    the user is dropped after `DebouncePolicy.max_failures` failures in a row.
+
+    Nothing is kept or scheduled for users without recent messages,
+    so the cost grows with active users only.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[int], Awaitable[None]],
+        on_evict: Callable[[int], None] | None = None,
+    ) -> None:
+        """
+        :param flush: answers the buffered messages of a user;
+            flushes of one user never overlap
+        :param on_evict: called when an idle user is dropped
+        """
+        self.flush = flush
+        self.on_evict = on_evict
+        self.debouncers: dict[int, Debouncer] = {}
+        # (time, user_id); entries made outdated by newer messages are skipped when popped
+        self._timers: list[tuple[float, int]] = []
+        self._flushing: dict[int, asyncio.Task] = {}
+        # Consecutive failed flushes per user
+        self._failures: dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def debouncer(self, user_id: int) -> Debouncer:
+        """
+        :return: debouncer of the user, created if the user is not tracked
+        """
+        debouncer = self.debouncers.get(user_id)
+        if debouncer is None:
+            debouncer = self.debouncers[user_id] = Debouncer()
+            metrics.set("buffering.active_users", len(self.debouncers))
+        return debouncer
+
+    def message_arrived(self, user_id: int) -> None:
+        """
+        Must be called for every buffered message.
+
+        :param user_id: identifier for the conversation participant
+        """
+        debouncer = self.debouncer(user_id)
+        debouncer.message_arrived()
+        self._schedule(user_id, debouncer.deadline())
+
+    def evict(self, user_id: int) -> None:
+        """
+        Stops tracking the user, e.g. once the dialog is finished.
+
+        :param user_id: identifier for the conversation participant
+        """
+        self._failures.pop(user_id, None)
+        if self.debouncers.pop(user_id, None) is None:
+            return
+        metrics.set("buffering.active_users", len(self.debouncers))
+        if self.on_evict is not None:
+            self.on_evict(user_id)
+
+    async def close(self) -> None:
+        """
+        Stops the timer and cancels running flushes.
+        """
+        tasks = list(self._flushing.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def _schedule(self, user_id: int, when: float) -> None:
+        if not self._timers or when < self._timers[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._timers, (when, user_id))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, user_id = heapq.heappop(self._timers)
+                self._fire(user_id, now)
+
+            timeout = self._timers[0][0] - now if self._timers else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+    def _fire(self, user_id: int, now: float) -> None:
+        debouncer = self.debouncers.get(user_id)
+        if debouncer is None or user_id in self._flushing:
+            # The running flush schedules the user again when it ends
+            return
+
+        deadline = debouncer.deadline()
+        if deadline is None:
+            idle_until = debouncer.last_message_at + debouncer.policy.idle_timeout
+            if idle_until <= now:
+                self.evict(user_id)
+        elif deadline <= now:
+            task = asyncio.create_task(self._flush(user_id))
+            self._flushing[user_id] = task
+
+    async def _flush(self, user_id: int) -> None:
+        failed = False
+        try:
+            await self.flush(user_id)
+        except Exception as e:
+            failed = True
+            logger.error(f"Error flushing messages of user {user_id}: {e}")
+        finally:
+            del self._flushing[user_id]
+
+        debouncer = self.debouncers.get(user_id)
+        if debouncer is None:
+            return
+        if failed:
+            failures = self._failures.get(user_id, 0) + 1
+            metrics.increment("buffering.flush_failures")
+            if failures >= debouncer.policy.max_failures:
+                logger.error(f"Dropping user {user_id} after {failures} failed flushes")
+                metrics.increment("buffering.users_dropped")
+                self.evict(user_id)
+                return
+            self._failures[user_id] = failures
+            # Also holds back the flush if more messages arrive meanwhile
+            debouncer.postpone(debouncer.policy.failure_delay(failures))
+        else:
+            self._failures.pop(user_id, None)
+        # Messages which arrived during the flush are due on their own,
+        # otherwise the user is dropped unless they write again
+        deadline = debouncer.deadline()
+        if deadline is None:
+            deadline = debouncer.last_message_at + debouncer.policy.idle_timeout
+        self._schedule(user_id, deadline)
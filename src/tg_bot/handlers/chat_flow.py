@@ -1,69 +1,105 @@
+from dataclasses import dataclass
 import asyncio
-from dataclasses import dataclass, field
 import logging
+import os
+import socket
+import time
 
-from aiogram import Router, F, types
+from aiogram import Bot, Router, F, types
 from aiogram.filters import Command
 from aiogram.types import ContentType
 from aiogram.utils import keyboard
+from tortoise import expressions
 
 from src import chat
+from src import persistence
+from src.persistence import invalidations
+from src import types as chat_types
 from src.tg_bot import middlewares
 from src.tg_bot import chat_settings
+from src.tg_bot import buffering
+from src.tg_bot import topics
 from src.persistence.models import Manager, UserManager, User
+from src.utils.metrics import metrics
 
 
 @dataclass
 class UserMessageBuffer:
-    supergroup_id: int
-    topic_group_id: int
-    chat_manager: chat.ChatManager
-    stored_messages: list[types.Message] = field(default_factory=list)
-
-    def store(self, message: types.Message) -> None:
-        self.stored_messages.append(message)
-
-    def clear(self) -> None:
-        self.stored_messages.clear()
+    """
+    What is needed to reply to a user. The messages themselves
+    are kept in `message_store`, so they survive restarts.
+    """
 
+    topic_mirror: topics.TopicMirror
+    chat_manager: chat.ChatManager
+    debouncer: buffering.Debouncer
+    reply_task: asyncio.Task | None = None
+
+    def supersede_reply(self, user_id: int) -> None:
+        """
+        Cancels the running reply, which a newer message makes outdated,
+        unless it has started storing the turn. The next flush replies
+        to all messages at once.
+        """
+        if self.reply_task is None or self.reply_task.done():
+            return
+        if self.debouncer.overdue():
+            # Otherwise a user who keeps typing would never get a reply
+            return
+        if self.chat_manager.reply_cancellable(user_id):
+            self.reply_task.cancel()
+            metrics.increment("chat_flow.replies_superseded")
+
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+"""
+Owner of the leases taken by this process.
+"""
+
+LEASE_TTL = 300.0
+"""
+Seconds after which the lease of a worker which died while replying expires.
+Must be longer than any reply takes.
+"""
+
+LEASE_RETRY_DELAY = 5.0
+"""
+Wait before trying again when another worker is replying to the user.
+"""
 
 router = Router()
-router.message.middleware(middlewares.ExpectSuperGroupSetMiddleware())
-router.message.middleware(middlewares.CreateUserAndTopicGroupMiddleware())
+router.message.middleware(
+    middlewares.DialogContextMiddleware(middlewares.dialog_contexts)
+)
 router.message.middleware(middlewares.FinishedUsersMiddleware())
 
 logger = logging.getLogger(__name__)
 
 message_buffer: dict[int, UserMessageBuffer] = {}
 
+message_store: chat_types.MessageBuffer = persistence.TortoiseMessageBuffer()
+
 
 @router.message(Command("start"), F.chat.type == "private")
 async def start(
     message: types.Message,
-    supergroup_id: int,
-    topic_group_id: int,
+    topic_mirror: topics.TopicMirror,
+    dialog_context: middlewares.DialogContext,
     chat_manager: chat.ChatManager,
     airtable_daily_tracker: middlewares.airtable.AirtableDailyTracker,
     airtable_users_counter: middlewares.airtable.AirtableUsersCounter,
 ) -> None:
     bot_msg = await message.answer(chat_settings.INTRODUCTION)
-    await bot_msg.send_copy(
-        chat_id=supergroup_id,
-        message_thread_id=topic_group_id,
-    )
+    await topic_mirror.send_copy(bot_msg)
 
     bot_msg = await message.answer(
         await chat_manager.current_question(message.from_user.id)
     )
-    await bot_msg.send_copy(
-        chat_id=supergroup_id,
-        message_thread_id=topic_group_id,
-    )
+    await topic_mirror.send_copy(bot_msg)
 
-    user_id = message.from_user.id
-    await increase_messages_count(user_id)
+    await increase_messages_count(dialog_context)
     await update_statistics(
-        user_id=user_id,
+        dialog_context=dialog_context,
         airtable_daily_tracker=airtable_daily_tracker,
         airtable_users_counter=airtable_users_counter,
     )
@@ -72,223 +108,258 @@ async def start(
 @router.message(F.content_type == ContentType.VOICE, F.chat.type == "private")
 async def voice_message(
     message: types.Message,
-    supergroup_id: int,
-    topic_group_id: int,
+    topic_mirror: topics.TopicMirror,
 ) -> None:
     bot_msg = await message.answer(
         "Bro, please write the lyrics, I can't listen to it right now."
     )
-    await bot_msg.send_copy(
-        chat_id=supergroup_id,
-        message_thread_id=topic_group_id,
-    )
+    await topic_mirror.send_copy(bot_msg)
 
 
 @router.message(F.content_type != ContentType.TEXT, F.chat.type == "private")
 async def not_text_message(
     message: types.Message,
-    supergroup_id: int,
-    topic_group_id: int,
+    topic_mirror: topics.TopicMirror,
 ) -> None:
     bot_msg = await message.answer("Bro, please write the lyrics")
-    await bot_msg.send_copy(
-        chat_id=supergroup_id,
-        message_thread_id=topic_group_id,
-    )
+    await topic_mirror.send_copy(bot_msg)
 
 
 @router.message(F.chat.type == "private")
 async def handle_message_from_user(
     message: types.Message,
-    supergroup_id: int,
-    topic_group_id: int,
+    topic_mirror: topics.TopicMirror,
+    dialog_context: middlewares.DialogContext,
     chat_manager: chat.ChatManager,
     airtable_daily_tracker: middlewares.airtable.AirtableDailyTracker,
     airtable_users_counter: middlewares.airtable.AirtableUsersCounter,
 ) -> None:
     user_id = message.from_user.id
 
-    # If this is the first time we've seen this user, create their buffer and start its task
-    if user_id not in message_buffer:
-        buf = UserMessageBuffer(
-            supergroup_id=supergroup_id,
-            topic_group_id=topic_group_id,
+    # Buffers exist only for users with recent messages, see `flush_scheduler`
+    buf = message_buffer.get(user_id)
+    if buf is None:
+        buf = message_buffer[user_id] = UserMessageBuffer(
+            topic_mirror=topic_mirror,
             chat_manager=chat_manager,
+            debouncer=flush_scheduler.debouncer(user_id),
         )
-        message_buffer[user_id] = buf
-
-        # Create a per‐user flushing coroutine
-        buf.flushing_task = asyncio.create_task(_per_user_flusher(user_id))
+    buf.topic_mirror = topic_mirror
 
     # Store the incoming text into that user's buffer
-    message_buffer[user_id].store(message)
-    await increase_messages_count(user_id=user_id)
+    await message_store.push(
+        user_id, message.chat.id, message.message_id, message.text or ""
+    )
+    flush_scheduler.message_arrived(user_id)
+    buf.supersede_reply(user_id)
+    await increase_messages_count(dialog_context)
     await update_statistics(
-        user_id=user_id,
+        dialog_context=dialog_context,
         airtable_daily_tracker=airtable_daily_tracker,
         airtable_users_counter=airtable_users_counter,
     )
 
 
-async def _per_user_flusher(user_id: int) -> None:
+async def _flush(user_id: int) -> None:
+    """
+    Called by `flush_scheduler` once the user stops typing (see `buffering.DebouncePolicy`).
+    Replies to the buffered messages while holding the user's lease,
+    so that no other worker replies to them at the same time.
+    Database errors are raised once the lease is released: the messages stay
+    buffered and `flush_scheduler` retries with a backoff.
+    """
+    buf = message_buffer.get(user_id)
+    if buf is None:
+        return
+
+    taken, last_owner = await message_store.acquire(user_id, WORKER_ID, LEASE_TTL)
+    if not taken:
+        # The other worker's reply may cover these messages, otherwise they are answered later
+        buf.debouncer.postpone(LEASE_RETRY_DELAY)
+        return
+    try:
+        if last_owner not in (None, WORKER_ID):
+            # Another worker replied last, what this one cached may be outdated
+            buf.chat_manager.invalidate_cached_state(user_id)
+            dialog_context = await middlewares.dialog_contexts.load(user_id)
+            if dialog_context is not None:
+                buf.topic_mirror = topics.TopicMirror(
+                    buf.topic_mirror.bot, dialog_context.topic
+                )
+        await _reply(user_id, buf)
+    finally:
+        try:
+            await message_store.release(user_id, WORKER_ID)
+        except Exception as e:
+            # The lease expires after LEASE_TTL anyway
+            logger.error(f"Error releasing the lease of user {user_id}: {e}")
+
+
+async def _reply(user_id: int, buf: UserMessageBuffer) -> None:
     """
-    This task wakes up every 30 seconds and—*for this single user*—checks
-    if there are buffered messages. If there are, it calls chat_manager.reply(),
-    sends the reply, copies it to the supergroup, notifies manager if finished,
-    and clears the buffer. Once the dialog is finished, or if we fail repeatedly,
-    it simply returns (exits).
+    Calls chat_manager.reply() with all buffered messages, sends the reply,
+    copies it to the supergroup, notifies manager if finished, and clears the buffer.
+    Once the dialog is finished, or if anything fails, the user is evicted
+    and the next message starts over.
     """
-    buf = message_buffer[user_id]
+    pending = await message_store.pending(user_id)
+    if not pending:
+        buf.debouncer.batch_done()
+        return
+
+    # 1) Combine all pending texts
+    combined_user_text = " ".join(msg.text for msg in pending if msg.text).strip()
 
-    need_to_sleep = True
+    # 2) Ask chat_manager for a reply; a new message from the user cancels it
+    # (see `UserMessageBuffer.supersede_reply`) and the scheduler flushes again.
+    # The answered messages are removed in the transaction storing the turn,
+    # so they are never answered twice, even if sending fails
+    last_message_at = buf.debouncer.last_message_at
+
+    async def consume_input() -> None:
+        await message_store.remove(user_id, pending[-1].id)
+
+    buf.reply_task = asyncio.create_task(
+        buf.chat_manager.reply(user_id, combined_user_text, consume_input)
+    )
     try:
-        while True:
-            if need_to_sleep:
-                await asyncio.sleep(30)  # wait 30 seconds between flushes
-                need_to_sleep = False
-
-            # If the user buffer has no messages, just loop again
-            if not buf.stored_messages:
-                # But first check if the dialog is finished; if yes, exit the loop
-                try:
-                    finished = await buf.chat_manager.has_user_finished(user_id)
-                except Exception as e:
-                    logger.error(f"Error checking finished status for {user_id}: {e}")
-                    # If we can't even check, it might be safer to exit
-                    finished = True
-
-                if finished:
-                    break
-                continue
-
-            # 1) Combine all pending texts
-            stored_messages = buf.stored_messages.copy()
-            combined_user_text = " ".join(
-                msg.text for msg in stored_messages if msg.text
-            ).strip()
-
-            # 2) Ask chat_manager for a reply
-            try:
-                reply_text = await buf.chat_manager.reply(user_id, combined_user_text)
-            except Exception as e:
-                logger.error(f"Error generating reply for user {user_id}: {e}")
-                # If chat_manager is broken, just clear and exit
-                buf.clear()
-                break
-
-            # 2.1) Check if user write anything new - they may have provided new information,
-            # which we need for a complete answer
-            if len(stored_messages) < len(buf.stored_messages):
-                need_to_sleep = False
-                continue
+        reply_text = await buf.reply_task
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+        return
+    except Exception as e:
+        logger.error(f"Error generating reply for user {user_id}: {e}")
+        # If chat_manager is broken, just drop the buffer
+        await message_store.remove(user_id, pending[-1].id)
+        flush_scheduler.evict(user_id)
+        return
+    finally:
+        buf.reply_task = None
+
+    # 2.1) Messages which arrived while the turn was being stored
+    # are answered on their own
+    buf.debouncer.batch_done(answered_until=last_message_at)
+
+    # The turn is stored: other workers drop what they cached about the user,
+    # e.g. the finished status read before any lease is taken
+    await invalidations.get_bus().publish(invalidations.CHAT_STATE, user_id)
+
+    if not reply_text:
+        # Nothing may have been stored, e.g. if the dialog is already finished
+        await message_store.remove(user_id, pending[-1].id)
+        flush_scheduler.evict(user_id)
+        return
+
+    # 3) Send the reply into the chat of the last user message
+    bot = buf.topic_mirror.bot
+    chat_id = pending[-1].chat_id
+    try:
+        bot_msg = await bot.send_message(chat_id=chat_id, text=reply_text)
+    except Exception as e:
+        logger.error(f"Error sending reply to {user_id}: {e}")
+        flush_scheduler.evict(user_id)
+        return
+    # What the debounce policy is tuned by: users should not wait
+    # long, but a message split in parts should get one reply
+    metrics.observe("chat_flow.reply_delay_s", time.monotonic() - last_message_at)
+    metrics.observe("chat_flow.messages_per_reply", len(pending))
+
+    # 4) Copy that bot message into the supergroup/topic
+    try:
+        await buf.topic_mirror.send_copy(bot_msg)
+    except Exception as e:
+        topic = buf.topic_mirror.topic
+        logger.error(
+            f"Error copying bot message for user {user_id} "
+            f"into supergroup {topic.supergroup_id}, topic {topic.thread_id}: {e}"
+        )
+
+    # 5) If finished, notify the manager
+    try:
+        finished = await buf.chat_manager.has_user_finished(user_id)
+    except Exception as e:
+        logger.error(f"Error checking finished status for user {user_id}: {e}")
+        finished = False
+
+    if finished:
+        try:
+            user_manager = (
+                await UserManager.filter(user_id=user_id).first()
+                or await Manager.first()
+            )
+            if user_manager:
+                bot_msg = await bot.send_message(
+                    chat_id,
+                    f"Your personal manager {user_manager.manager_link} will contact you soon.",
+                )
             else:
-                need_to_sleep = True
-                buf.clear()
-
-            if not reply_text:
-                buf.clear()
-                break
-
-            # 3) Send the reply under the last user message
-            last_user_msg = stored_messages[-1]
-            try:
-                bot_msg = await last_user_msg.answer(reply_text)
-            except Exception as e:
-                logger.error(f"Error sending reply to {user_id}: {e}")
-                buf.clear()
-                break
-
-            # 4) Copy that bot message into the supergroup/topic
-            try:
-                await bot_msg.send_copy(
-                    chat_id=buf.supergroup_id,
-                    message_thread_id=buf.topic_group_id,
+                bot_msg = await bot.send_message(
+                    chat_id, "A personal manager will contact you soon."
                 )
-            except Exception as e:
-                logger.error(
-                    f"Error copying bot message for user {user_id} "
-                    f"into supergroup {buf.supergroup_id}, topic {buf.topic_group_id}: {e}"
+            await buf.topic_mirror.send_copy(bot_msg)
+
+            builder = keyboard.InlineKeyboardBuilder()
+            builder.row(
+                types.InlineKeyboardButton(
+                    text="User",
+                    url=f"tg://user?id={user_id}",
                 )
+            )
+            await buf.topic_mirror.send_message(
+                "Link to user account",
+                reply_markup=builder.as_markup(),
+            )
 
-            # 5) If finished, notify the manager
-            try:
-                finished = await buf.chat_manager.has_user_finished(user_id)
-            except Exception as e:
-                logger.error(f"Error checking finished status for user {user_id}: {e}")
-                finished = False
-
-            if finished:
-                try:
-                    user = await User.filter(id=user_id).first()
-                    user_manager = (
-                        await UserManager.filter(user=user).first()
-                        or await Manager.first()
-                    )
-                    if user_manager:
-                        bot_msg = await last_user_msg.answer(
-                            f"Your personal manager {user_manager.manager_link} will contact you soon."
-                        )
-                    else:
-                        bot_msg = await last_user_msg.answer(
-                            "A personal manager will contact you soon."
-                        )
-                    await bot_msg.send_copy(
-                        chat_id=buf.supergroup_id,
-                        message_thread_id=buf.topic_group_id,
-                    )
-
-                    builder = keyboard.InlineKeyboardBuilder()
-                    builder.row(
-                        types.InlineKeyboardButton(
-                            text="User",
-                            url=f"tg://user?id={user.id}",
-                        )
-                    )
-                    await last_user_msg.bot.send_message(
-                        chat_id=buf.supergroup_id,
-                        message_thread_id=buf.topic_group_id,
-                        text="Link to user account",
-                        reply_markup=builder.as_markup(),
-                    )
-
-                except Exception as e:
-                    logger.error(
-                        f"Error sending manager notification to {user_id}: {e}"
-                    )
-                # Once finished, break out of the loop
-                buf.clear()
-                need_to_sleep = True
-                break
-
-            # 6) Clear the buffer (we’ve just processed all pending messages)
-            if len(stored_messages) < len(buf.stored_messages):
-                need_to_sleep = False
-                continue
-            else:
-                need_to_sleep = True
-                buf.clear()
+        except Exception as e:
+            logger.error(f"Error sending manager notification to {user_id}: {e}")
+        # The dialog is over, nothing is kept for the user
+        flush_scheduler.evict(user_id)
+
+
+flush_scheduler = buffering.FlushScheduler(
+    flush=_flush,
+    on_evict=lambda user_id: message_buffer.pop(user_id, None),
+)
 
-    except asyncio.CancelledError:
-        # If someone externally cancels the task, just clean up and exit
-        buf.clear()
-    finally:
-        # Remove the buffer and task from our dict so we don't leak
-        del message_buffer[user_id]
+
+async def recover(bot: Bot, chat_manager: chat.ChatManager) -> None:
+    """
+    Schedules replies to messages which were buffered when the bot stopped.
+    Must be called once at startup; with several workers, whichever takes
+    the lease of a user replies.
+    """
+    for user_id in await message_store.users_with_pending():
+        if user_id in message_buffer:
+            continue
+        dialog_context = await middlewares.dialog_contexts.load(user_id)
+        if dialog_context is None:
+            logger.warning(f"Cannot reply to buffered messages of user {user_id}")
+            continue
+        message_buffer[user_id] = UserMessageBuffer(
+            topic_mirror=topics.TopicMirror(bot, dialog_context.topic),
+            chat_manager=chat_manager,
+            debouncer=flush_scheduler.debouncer(user_id),
+        )
+        flush_scheduler.message_arrived(user_id)
+        logger.info(f"Recovered buffered messages of user {user_id}")
 
 
-async def increase_messages_count(user_id: int):
-    user = await User.filter(id=user_id).first()
-    user.sent_messages_count += 1
-    await user.save()
+async def increase_messages_count(dialog_context: middlewares.DialogContext):
+    # Incremented in the database, so no other row changes are overwritten
+    await User.filter(id=dialog_context.user_id).update(
+        sent_messages_count=expressions.F("sent_messages_count") + 1
+    )
+    dialog_context.sent_messages_count += 1
 
 
 async def update_statistics(
-    user_id: int,
+    dialog_context: middlewares.DialogContext,
     airtable_daily_tracker: middlewares.airtable.AirtableDailyTracker,
     airtable_users_counter: middlewares.airtable.AirtableUsersCounter,
 ) -> None:
-    user = await User.filter(id=user_id).first()
-    sent_messages_count = user.sent_messages_count
+    user_id = dialog_context.user_id
+    sent_messages_count = dialog_context.sent_messages_count
 
     logger.info(f"Message count of user {user_id}: {sent_messages_count}")
     if sent_messages_count == 1:
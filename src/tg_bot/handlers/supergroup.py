@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
 import os
 import re
 
@@ -15,8 +15,11 @@ from src.persistence.models import (
     User,
 )
 
-from src.chat import ChatManager
+from src.chat import ChatManager, llm_scheduler, usage
 from src import processors
+from src.tg_bot import middlewares
+from src.persistence import invalidations, ledger
+from src.utils.metrics import metrics
 
 
 router = Router()
@@ -92,6 +95,93 @@ async def users_count_handler(message: types.Message) -> None:
     await message.reply(f"Total users: {total}")
 
 
+@router.message(Command("metrics"), F.chat.type == "supergroup")
+async def metrics_handler(message: types.Message) -> None:
+    """
+    Show in-process performance metrics (cache hits, latencies, etc.).
+    Counters are reset when the bot restarts.
+    """
+    report = metrics.report()
+    await message.reply(report or "No metrics collected yet")
+
+
+@router.message(Command("costs"), F.chat.type == "supergroup")
+async def costs(message: types.Message, command: CommandObject) -> None:
+    """
+    Show token usage, cost and latency of agent calls.
+    Command `/costs [days]` covers the given number of days (7 by default).
+    """
+    days = 7
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.reply("Использование: /costs [количество дней]")
+            return
+        days = int(command.args.strip())
+    since = datetime.now(UTC) - timedelta(days=days)
+
+    by_agent = await ledger.usage_by_agent(since)
+    if not by_agent:
+        await message.reply(f"No agent calls in the last {days} days")
+        return
+    by_question = await ledger.usage_by_question(since)
+    by_day = await ledger.usage_by_day(since)
+
+    lines = [f"Agent calls in the last {days} days", "", "By agent:"]
+    for row in by_agent:
+        lines.append(
+            f"{row['agent']}: {row['calls']} calls, "
+            f"{row['prompt_tokens_sum']}+{row['completion_tokens_sum']} tokens, "
+            f"${row['cost_sum']:.4f}, avg {row['latency_avg']:.2f}s"
+        )
+    lines += ["", "By question:"]
+    for row in by_question:
+        lines.append(
+            f"#{row['question_index'] + 1}: {row['calls']} calls, "
+            f"${row['cost_sum']:.4f}, avg {row['latency_avg']:.2f}s"
+        )
+    lines += ["", "By day:"]
+    for row in by_day:
+        lines.append(
+            f"{row['day']:%d.%m.%Y}: {row['calls']} calls, "
+            f"{row['prompt_tokens_sum'] + row['completion_tokens_sum']} tokens, "
+            f"${row['cost_sum']:.4f}"
+        )
+    await message.reply("\n".join(lines))
+
+
+@router.message(
+    Command("pipeline"),
+    F.chat.type == "supergroup",
+    F.message_thread_id.is_(None),
+)
+async def pipeline(
+    message: types.Message,
+    command: CommandObject,
+    chat_manager: ChatManager,
+) -> None:
+    """
+    Show or switch the response pipeline used for user replies.
+    Command `/pipeline` shows the current one, `/pipeline <name>` switches to it.
+    Must be called in the General chat.
+    """
+    available = ", ".join(chat_manager.response_generators)
+    if not command.args:
+        await message.reply(
+            f"Current pipeline: {chat_manager.response_generator_name}\n"
+            f"Available: {available}"
+        )
+        return
+
+    name = command.args.strip()
+    try:
+        chat_manager.select_response_generator(name)
+    except KeyError:
+        await message.reply(f"Unknown pipeline {name!r}. Available: {available}")
+        return
+
+    await message.reply(f"Pipeline switched to {name}")
+
+
 @router.message(Command("export_to_airtable"), F.chat.type == "supergroup")
 async def export_to_airtable(
     message: types.Message,
@@ -105,12 +195,15 @@ async def export_to_airtable(
 
     await message.reply(f"Found {len(users)} users. Sending to airtable...")
 
-    for user in users:
-        if await chat_manager.has_user_finished(
-            user.id
-        ):  # Only include users who have at least started answering
-            qa_pairs = await chat_manager.qa_pairs(user.id)
-            await airtable_processor(user.id, qa_pairs)
+    # Bulk export must not delay replies to users who are talking right now
+    with llm_scheduler.priority(llm_scheduler.Priority.BATCH):
+        for user in users:
+            if await chat_manager.has_user_finished(
+                user.id
+            ):  # Only include users who have at least started answering
+                qa_pairs = await chat_manager.qa_pairs(user.id)
+                with usage.tagged(user.id):
+                    await airtable_processor(user.id, qa_pairs)
 
 
 @router.message(Command("attach"), F.chat.type == "supergroup")
@@ -122,6 +215,8 @@ async def attach(message: types.Message) -> None:
     group = await SuperGroup.filter(group_id=message.chat.id).first()
     if group is None:
         group = await SuperGroup.create(group_id=message.chat.id)
+        middlewares.dialog_contexts.invalidate()
+        await invalidations.get_bus().publish(invalidations.DIALOG_CONTEXTS)
         reply = f"Default supergroup set to {group.group_id}"
     else:
         reply = f"Supergroup already set: {group.group_id}"
@@ -142,6 +237,8 @@ async def detach(message: types.Message) -> None:
     else:
         # Delete that one record
         await group.delete()
+        middlewares.dialog_contexts.invalidate()
+        await invalidations.get_bus().publish(invalidations.DIALOG_CONTEXTS)
         reply = f"Supergroup ({group.group_id}) unset"
 
     await message.reply(reply)
@@ -287,6 +384,7 @@ async def learn(
         )
     else:
         await chat_manager.learn(instructions=instructions)
+    await invalidations.get_bus().publish(invalidations.INSTRUCTIONS)
 
     await message.reply("Instructions learned")
 
@@ -327,9 +425,31 @@ async def forget(
     Must be called in the topic chat.
     """
     await chat_manager.context.clear()
+    await invalidations.get_bus().publish(invalidations.INSTRUCTIONS)
     await message.reply("Instructions forgotten")
 
 
+@router.message(
+    Command("compact_instructions"),
+    F.chat.type == "supergroup",
+    F.message_thread_id.is_not(None),
+)
+async def compact_instructions(
+    message: types.Message,
+    chat_manager: ChatManager,
+) -> None:
+    """
+    Merge learned instructions into one deduplicated block.
+    Command `/compact_instructions` - compact the instructions of the bot.
+    Must be called in the topic chat.
+    """
+    if await chat_manager.compact_instructions():
+        await invalidations.get_bus().publish(invalidations.INSTRUCTIONS)
+        await message.reply("Instructions compacted")
+    else:
+        await message.reply("Nothing to compact")
+
+
 @router.message(
     Command("unfinished"),
     F.chat.type == "supergroup",
@@ -454,6 +574,7 @@ async def stop_talking_with(message: types.Message, chat_manager: ChatManager) -
         os.remove(pdf_filename)
 
     await chat_manager.stop_talking_with(user.id)
+    await invalidations.get_bus().publish(invalidations.CHAT_STATE, user.id)
 
     user_manager = (
         await UserManager.filter(user_id=user.id).first() or await Manager.first()
@@ -1,6 +1,10 @@
-from .expect_super_group_set import ExpectSuperGroupSetMiddleware
+from .dialog_context import (
+    DialogContext,
+    DialogContextCache,
+    DialogContextMiddleware,
+    dialog_contexts,
+)
 from .filter_users import FinishedUsersMiddleware
-from .create_topic_group import CreateUserAndTopicGroupMiddleware
 from .chat_manager import ChatManagerMiddleware
 from .allowed_ids import AllowedIdsMiddleware
 from .airtable.processor_middleware import AirtableMiddleware
@@ -11,8 +15,10 @@ from . import airtable
 __all__ = [
     "airtable",
     "FinishedUsersMiddleware",
-    "ExpectSuperGroupSetMiddleware",
-    "CreateUserAndTopicGroupMiddleware",
+    "DialogContext",
+    "DialogContextCache",
+    "DialogContextMiddleware",
+    "dialog_contexts",
     "ChatManagerMiddleware",
     "AllowedIdsMiddleware",
     "AirtableMiddleware",
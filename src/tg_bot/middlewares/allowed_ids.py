@@ -41,6 +41,8 @@ class AllowedIdsMiddleware(BaseMiddleware):
                 or command.startswith("/set_manager@")
                 or command == "/unset_manager"
                 or command.startswith("/unset_manager")
+                or command == "/pipeline"
+                or command.startswith("/pipeline@")
             ):
                 # 1) Fetch all telegram_id values from Manager and UserManager
                 manager_ids_from_manager = await models.Manager.all().values_list(
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from src.persistence.models import SuperGroup, TopicGroup, User
+from src.tg_bot import topics
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_UNKNOWN = object()
+
+
+@dataclass
+class DialogContext:
+    """
+    Everything handlers of a private message need to know about its sender.
+    """
+
+    user_id: int
+    topic: topics.Topic
+    sent_messages_count: int
+
+    @property
+    def supergroup_id(self) -> int:
+        return self.topic.supergroup_id
+
+    @property
+    def topic_group_id(self) -> int:
+        return self.topic.thread_id
+
+
+class DialogContextCache:
+    """
+    Dialog contexts of recently active users and the attached supergroup.
+
+    Values are cached in process memory: every change of the supergroup must
+    invalidate them, and a worker taking over a user from another one must
+    `load` the user again. Recreated topics are updated in place.
+    """
+
+    def __init__(self, max_users: int = 10_000) -> None:
+        """
+        :param max_users: how many users are kept, least recently used are evicted
+        """
+        self._max_users = max_users
+        self._contexts: OrderedDict[int, DialogContext] = OrderedDict()
+        self._supergroup_id: Any = _UNKNOWN
+
+    def get(self, user_id: int) -> DialogContext | None:
+        context = self._contexts.get(user_id)
+        if context is None:
+            metrics.increment("dialog_context.misses")
+        else:
+            metrics.increment("dialog_context.hits")
+            self._contexts.move_to_end(user_id)
+        return context
+
+    def put(self, context: DialogContext) -> None:
+        self._contexts[context.user_id] = context
+        self._contexts.move_to_end(context.user_id)
+        if len(self._contexts) > self._max_users:
+            self._contexts.popitem(last=False)
+
+    async def supergroup_id(self) -> int | None:
+        """
+        :return: ID of the attached supergroup (None if the bot is not attached)
+        """
+        if self._supergroup_id is _UNKNOWN:
+            self._supergroup_id = await SuperGroup.first().values_list(
+                "group_id", flat=True
+            )
+        return self._supergroup_id
+
+    async def load(self, user_id: int) -> DialogContext | None:
+        """
+        Loads the context of a known user without a message from them,
+        e.g. to answer messages buffered before a restart. Nothing is created.
+
+        :param user_id: identifier for the conversation participant
+        :return: the cached context (None if the bot is not attached
+            or the user has no topic)
+        """
+        supergroup_id = await self.supergroup_id()
+        if supergroup_id is None:
+            return None
+        topic_group = (
+            await TopicGroup.filter(user_id=user_id).select_related("user").first()
+        )
+        if topic_group is None:
+            return None
+
+        context = DialogContext(
+            user_id=user_id,
+            topic=topics.Topic(
+                user_id=user_id,
+                supergroup_id=supergroup_id,
+                thread_id=topic_group.topic_group_id,
+                name=topic_group.user.name,
+            ),
+            sent_messages_count=topic_group.user.sent_messages_count,
+        )
+        self.put(context)
+        return context
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        """
+        Drops the cached context of a user, or everything (including
+        the supergroup) if no user is given, e.g. after `/attach` or `/detach`.
+
+        :param user_id: identifier for the conversation participant
+        """
+        if user_id is None:
+            self._contexts.clear()
+            self._supergroup_id = _UNKNOWN
+        else:
+            self._contexts.pop(user_id, None)
+
+
+dialog_contexts = DialogContextCache()
+"""
+Contexts shared by the private chat middleware and the supergroup commands
+which invalidate them.
+"""
+
+
+class DialogContextMiddleware(BaseMiddleware):
+    """
+    Assembles the `DialogContext` of the sender and puts it into `data`
+    with a `topic_mirror` for copying messages into the user's topic
+    (also `supergroup_id` and `topic_group_id` on their own).
+
+    On a cache miss:
+      1) The supergroup must be attached, otherwise the message is ignored.
+      2) The User and their TopicGroup are loaded in one query, and created if missing.
+
+    A deleted forum topic is recreated by the mirror when writing into it fails.
+    """
+
+    def __init__(self, cache: DialogContextCache) -> None:
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict], Awaitable[Any]],
+        event: Message,
+        data: dict,
+    ) -> Any:
+        context = self.cache.get(event.from_user.id)
+        if context is None:
+            supergroup_id = await self.cache.supergroup_id()
+            if supergroup_id is None:
+                logger.error(
+                    "No supergroup selected. Use /attach in a supergroup first. "
+                    "Messages will be ignored. "
+                    f"Request from user {event.from_user.full_name} (id: {event.from_user.id})"
+                )
+                return
+            context = await self._load(event, supergroup_id)
+            self.cache.put(context)
+
+        data["dialog_context"] = context
+        data["topic_mirror"] = topics.TopicMirror(event.bot, context.topic)
+        data["supergroup_id"] = context.supergroup_id
+        data["topic_group_id"] = context.topic_group_id
+        return await handler(event, data)
+
+    async def _load(self, event: Message, supergroup_id: int) -> DialogContext:
+        topic_group = (
+            await TopicGroup.filter(user_id=event.from_user.id)
+            .select_related("user")
+            .first()
+        )
+
+        if topic_group is None:
+            name = event.from_user.username or event.from_user.full_name
+            user, _ = await User.get_or_create(
+                id=event.from_user.id,
+                defaults={
+                    "name": name,
+                    "url": event.from_user.url,
+                },
+            )
+            forum_topic = await event.bot.create_forum_topic(
+                chat_id=supergroup_id,
+                name=event.from_user.full_name,
+            )
+            topic_group = await TopicGroup.create(
+                user=user,
+                topic_group_id=forum_topic.message_thread_id,
+            )
+        else:
+            user = topic_group.user
+
+        topic = topics.Topic(
+            user_id=user.id,
+            supergroup_id=supergroup_id,
+            thread_id=topic_group.topic_group_id,
+            name=event.from_user.full_name,
+        )
+        return DialogContext(
+            user_id=user.id,
+            topic=topic,
+            sent_messages_count=user.sent_messages_count,
+        )
@@ -4,6 +4,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message
 
 from src import chat
+from src.tg_bot import topics
 
 
 DEFAULT_MESSAGE = (
@@ -26,18 +27,13 @@ class FinishedUsersMiddleware(BaseMiddleware):
     ) -> Any:
         # Пересылаем сообщение пользователя в топик-группу
         # в любом случае, даже если пользователь закончил диалог
-        await event.forward(
-            chat_id=data["supergroup_id"],
-            message_thread_id=data["topic_group_id"],
-        )
+        topic_mirror: topics.TopicMirror = data["topic_mirror"]
+        await topic_mirror.forward(event)
 
         chat_manager: chat.ChatManager = data["chat_manager"]
         if await chat_manager.has_user_finished(event.from_user.id):
             bot_msg = await event.answer(DEFAULT_MESSAGE)
-            await bot_msg.send_copy(
-                chat_id=data["supergroup_id"],
-                message_thread_id=data["topic_group_id"],
-            )
+            await topic_mirror.send_copy(bot_msg)
             return
 
         return await handler(event, data)
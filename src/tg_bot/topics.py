@@ -0,0 +1,143 @@
+"""
+Forum topics of the supergroup where dialogs with users are mirrored.
+
+Topics are not checked in advance: a deleted topic is noticed when
+mirroring into it fails, then it is recreated and the message is sent again.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+import asyncio
+import logging
+
+from aiogram import Bot, exceptions
+from aiogram.types import Message
+
+from src.persistence.models import TopicGroup
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_THREAD_NOT_FOUND = ("thread not found", "TOPIC_ID_INVALID", "TOPIC_DELETED")
+
+
+def is_thread_not_found(error: exceptions.TelegramBadRequest) -> bool:
+    return any(reason in error.message for reason in _THREAD_NOT_FOUND)
+
+
+@dataclass
+class Topic:
+    """
+    Forum topic of a user. Shared by everything mirroring into it,
+    so a recreated topic is seen by all of them.
+    """
+
+    user_id: int
+    supergroup_id: int
+    thread_id: int
+    name: str
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+
+async def recreate(bot: Bot, topic: Topic, failed_thread_id: int) -> None:
+    """
+    Creates a new forum topic instead of a deleted one and stores it,
+    unless another worker process has already done so.
+
+    :param bot: bot which manages the supergroup
+    :param topic: topic of the user
+    :param failed_thread_id: thread which was found missing
+    """
+    async with topic.lock:
+        # Concurrent mirrors may notice the same deleted topic
+        if topic.thread_id != failed_thread_id:
+            return
+        stored_thread_id = await _stored_thread_id(topic.user_id)
+        if stored_thread_id not in (None, failed_thread_id):
+            topic.thread_id = stored_thread_id
+            return
+
+        new_topic = await bot.create_forum_topic(
+            chat_id=topic.supergroup_id,
+            name=topic.name,
+        )
+        updated = await TopicGroup.filter(
+            user_id=topic.user_id, topic_group_id=failed_thread_id
+        ).update(topic_group_id=new_topic.message_thread_id)
+        if not updated and stored_thread_id is not None:
+            # Another worker recreated it meanwhile, its topic is kept
+            try:
+                await bot.delete_forum_topic(
+                    chat_id=topic.supergroup_id,
+                    message_thread_id=new_topic.message_thread_id,
+                )
+            except exceptions.TelegramAPIError as e:
+                logger.error(
+                    f"Failed to delete duplicate topic of user {topic.user_id}: {e}"
+                )
+            topic.thread_id = await _stored_thread_id(topic.user_id)
+            return
+
+        topic.thread_id = new_topic.message_thread_id
+        metrics.increment("topics.recreated")
+        logger.warning(
+            f"Topic {failed_thread_id} of user {topic.user_id} was not found, "
+            f"recreated as {topic.thread_id}"
+        )
+
+
+async def _stored_thread_id(user_id: int) -> int | None:
+    return (
+        await TopicGroup.filter(user_id=user_id)
+        .first()
+        .values_list("topic_group_id", flat=True)
+    )
+
+
+class TopicMirror:
+    """
+    Copies the dialog with a user into their topic,
+    recreating the topic if it was deleted.
+    """
+
+    def __init__(self, bot: Bot, topic: Topic) -> None:
+        self.bot = bot
+        self.topic = topic
+
+    async def forward(self, message: Message) -> Any:
+        return await self._mirror(
+            lambda thread_id: message.forward(
+                chat_id=self.topic.supergroup_id,
+                message_thread_id=thread_id,
+            )
+        )
+
+    async def send_copy(self, message: Message) -> Any:
+        return await self._mirror(
+            lambda thread_id: message.send_copy(
+                chat_id=self.topic.supergroup_id,
+                message_thread_id=thread_id,
+            )
+        )
+
+    async def send_message(self, text: str, **kwargs) -> Any:
+        return await self._mirror(
+            lambda thread_id: self.bot.send_message(
+                chat_id=self.topic.supergroup_id,
+                message_thread_id=thread_id,
+                text=text,
+                **kwargs,
+            )
+        )
+
+    async def _mirror(self, send: Callable[[int], Awaitable[Any]]) -> Any:
+        thread_id = self.topic.thread_id
+        try:
+            result = await send(thread_id)
+        except exceptions.TelegramBadRequest as e:
+            if not is_thread_not_found(e):
+                raise
+            await recreate(self.bot, self.topic, thread_id)
+            metrics.increment("topics.mirror_retries")
+            result = await send(self.topic.thread_id)
+        return result
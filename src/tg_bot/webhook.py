@@ -0,0 +1,96 @@
+"""
+Webhook mode: Telegram pushes updates to an aiohttp server
+instead of the bot polling for them.
+
+Several worker processes may listen on the same port (SO_REUSEPORT),
+the kernel spreads incoming connections between them.
+"""
+
+from dataclasses import dataclass
+import asyncio
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+@dataclass(frozen=True, slots=True)
+class WebhookSettings:
+    url: str
+    """
+    Public base URL Telegram sends updates to, e.g. `https://bot.example.com`.
+    """
+
+    secret_token: str
+    """
+    Sent by Telegram with every update, requests without it are rejected.
+    """
+
+    path: str = "/webhook"
+    host: str = "0.0.0.0"
+    port: int = 8080
+
+    workers: int = 1
+    """
+    Processes serving updates.
+    """
+
+    @property
+    def webhook_url(self) -> str:
+        return self.url.rstrip("/") + self.path
+
+
+def build_app(
+    dp: Dispatcher, bot: Bot, secret_token: str, path: str
+) -> web.Application:
+    """
+    :return: application feeding updates posted to `path` into the dispatcher
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def register(dp: Dispatcher, bot: Bot, settings: WebhookSettings) -> None:
+    """
+    Points Telegram at the server. Updates which arrived while
+    the bot was down are dropped, as in polling mode.
+    """
+    await bot.set_webhook(
+        url=settings.webhook_url,
+        secret_token=settings.secret_token,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+
+
+async def serve(dp: Dispatcher, bot: Bot, settings: WebhookSettings) -> None:
+    """
+    Serves updates until cancelled or stopped by SIGINT/SIGTERM.
+    """
+    runner = web.AppRunner(build_app(dp, bot, settings.secret_token, settings.path))
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        settings.host,
+        settings.port,
+        reuse_port=settings.workers > 1,
+    )
+    await site.start()
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        await runner.cleanup()
@@ -3,6 +3,8 @@ from .question import Question, QuestionList
 from .state import State, StateType
 from .storage import UserAnswerStorage
 from .context import Context
+from .user_info import UserInfoStorage
+from .message_buffer import MessageBuffer, PendingMessage
 
 __all__ = [
     "QaPair",
@@ -13,4 +15,7 @@ __all__ = [
     "StateType",
     "UserAnswerStorage",
     "Context",
+    "UserInfoStorage",
+    "MessageBuffer",
+    "PendingMessage",
 ]
@@ -29,3 +29,11 @@ class Context(ABC):
         """
         Removes any saved context.
         """
+
+    @abstractmethod
+    async def replace(self, information: str) -> None:
+        """
+        Replaces the whole context, e.g. with a condensed version of it.
+
+        :param information: the new context
+        """
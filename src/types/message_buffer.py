@@ -0,0 +1,81 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class PendingMessage:
+    """A user message the bot has not replied to yet."""
+
+    id: int
+    chat_id: int
+    message_id: int
+    text: str
+    received_at: datetime
+
+
+class MessageBuffer(ABC):
+    """
+    Defines the interface for keeping user messages until the bot replies to them.
+
+    Messages outlive the process, and a per-user lease makes sure only one
+    worker replies to a user at a time.
+    """
+
+    @abstractmethod
+    async def push(
+        self, user_id: int, chat_id: int, message_id: int, text: str
+    ) -> None:
+        """
+        Adds a message to the user's buffer.
+
+        :param user_id: identifier for the conversation participant
+        :param chat_id: chat the message was sent to
+        :param message_id: identifier of the message in the chat
+        :param text: text of the message
+        """
+
+    @abstractmethod
+    async def pending(self, user_id: int) -> list[PendingMessage]:
+        """
+        :param user_id: identifier for the conversation participant
+        :return: buffered messages of the user, oldest first
+        """
+
+    @abstractmethod
+    async def remove(self, user_id: int, up_to_id: int) -> None:
+        """
+        Removes the answered messages, keeping the ones which arrived later.
+
+        :param user_id: identifier for the conversation participant
+        :param up_to_id: `PendingMessage.id` of the last answered message
+        """
+
+    @abstractmethod
+    async def users_with_pending(self) -> list[int]:
+        """
+        :return: users who have buffered messages, e.g. to answer them after a restart
+        """
+
+    @abstractmethod
+    async def acquire(
+        self, user_id: int, owner: str, ttl: float
+    ) -> tuple[bool, str | None]:
+        """
+        Takes the lease of a user unless another owner holds it.
+
+        :param user_id: identifier for the conversation participant
+        :param owner: identifier of the worker
+        :param ttl: seconds after which the lease can be taken by others
+            (if the worker dies without releasing it)
+        :return: whether the lease was taken and who held it last (None if nobody)
+        """
+
+    @abstractmethod
+    async def release(self, user_id: int, owner: str) -> None:
+        """
+        Lets other workers take the lease.
+
+        :param user_id: identifier for the conversation participant
+        :param owner: identifier of the worker holding the lease
+        """
@@ -31,6 +31,25 @@ class QuestionList(ABC):
             (None if all questions are answered or user is not registered)
         """
 
+    @abstractmethod
+    async def current_question_index(self, user_id: int) -> int | None:
+        """
+        Provides the position of the next pending question in the question list.
+
+        :param user_id: identifier for the conversation participant
+        :return: zero-based index of the current question
+            (None if all questions are answered)
+        """
+
+    @abstractmethod
+    async def remaining_questions(self, user_id: int) -> list[Question]:
+        """
+        Provides the current question followed by all questions after it.
+
+        :param user_id: identifier for the conversation participant
+        :return: unanswered questions in order (empty if all questions are answered)
+        """
+
     @abstractmethod
     async def advance(self, user_id: int, answer: str) -> None:
         """
@@ -40,3 +40,27 @@ class UserAnswerStorage(ABC):
         :param user_id: identifier for the conversation participant
         :param new_answer: new draft answer
         """
+
+    @abstractmethod
+    async def segments(self, user_id: int) -> list[tuple[int, str]]:
+        """
+        Retrieves the draft as the appended parts, oldest first.
+
+        :param user_id: identifier for the conversation participant
+        :return: (segment ID, text) pairs (empty if nothing was stored)
+        """
+
+    @abstractmethod
+    async def replace_up_to(
+        self, user_id: int, segment_id: int, new_answer: str
+    ) -> bool:
+        """
+        Atomically replaces the segments up to `segment_id` (inclusive) with
+        `new_answer`, keeping the segments appended after them.
+
+        :param user_id: identifier for the conversation participant
+        :param segment_id: last replaced segment, as returned by `segments`
+        :param new_answer: text taking the place of the replaced segments
+        :return: False if the segment no longer exists (the draft was
+            cleared or replaced meanwhile) and nothing was changed
+        """
@@ -0,0 +1,28 @@
+from abc import ABC, abstractmethod
+
+
+class UserInfoStorage(ABC):
+    """
+    Defines the interface for storing structured information extracted from a user's answers.
+    Information is filled in incrementally, one answered question at a time.
+    """
+
+    @abstractmethod
+    async def get(self, user_id: int) -> tuple[dict, int] | None:
+        """
+        Retrieves the extracted information, if any.
+
+        :param user_id: identifier for the conversation participant
+        :return: the information and the number of answers it covers
+            (None if nothing was stored)
+        """
+
+    @abstractmethod
+    async def save(self, user_id: int, info: dict, answered: int) -> None:
+        """
+        Stores the extracted information, replacing the previous one.
+
+        :param user_id: identifier for the conversation participant
+        :param info: JSON-serializable information
+        :param answered: how many answers the information covers
+        """
@@ -16,6 +16,10 @@ def _get_env(key: str, default: Any | None = None) -> str:
     return value
 
 
+def _to_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 @dataclass(frozen=True, slots=True)
 class Config:
     openai_api_key: str
@@ -33,6 +37,37 @@ class Config:
     airtable_table_id_daily_tracker: str
     airtable_base_id_users_count: str
     airtable_table_id_users_count: str
+    openai_max_connections: int
+    openai_max_keepalive_connections: int
+    openai_keepalive_expiry: float
+    openai_timeout: float
+    response_cache_enabled: bool
+    response_cache_file: str
+    response_cache_size: int
+    response_cache_ttl: float
+    speculative_routing: bool
+    response_pipeline: str
+    openai_requests_per_minute: int
+    openai_tokens_per_minute: int
+    context_max_tokens: int
+    context_keep_turns: int
+    instructions_max_tokens: int
+    debounce_min_quiet: float
+    debounce_max_quiet: float
+    debounce_max_wait: float
+    buffer_idle_timeout: float
+    multi_question_extraction: bool
+    database_url: str | None
+    database_pool_min_size: int
+    database_pool_max_size: int
+    bot_mode: str
+    webhook_url: str | None
+    webhook_path: str
+    webhook_host: str
+    webhook_port: int
+    webhook_secret: str | None
+    webhook_workers: int
+    cache_invalidation_interval: float
 
 
 def load_config() -> Config:
@@ -54,4 +89,41 @@ def load_config() -> Config:
         airtable_table_id_daily_tracker=_get_env("AIRTABLE_TABLE_ID_DAILY_TRACKER"),
         airtable_base_id_users_count=_get_env("AIRTABLE_BASE_ID_USERS_COUNT"),
         airtable_table_id_users_count=_get_env("AIRTABLE_TABLE_ID_USERS_COUNT"),
+        openai_max_connections=int(_get_env("OPENAI_MAX_CONNECTIONS", "100")),
+        openai_max_keepalive_connections=int(
+            _get_env("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")
+        ),
+        openai_keepalive_expiry=float(_get_env("OPENAI_KEEPALIVE_EXPIRY", "60")),
+        openai_timeout=float(_get_env("OPENAI_TIMEOUT", "60")),
+        response_cache_enabled=_to_bool(_get_env("RESPONSE_CACHE_ENABLED", "true")),
+        response_cache_file=_get_env("RESPONSE_CACHE_FILE", "response_cache.sqlite3"),
+        response_cache_size=int(_get_env("RESPONSE_CACHE_SIZE", "1024")),
+        response_cache_ttl=float(_get_env("RESPONSE_CACHE_TTL", "604800")),
+        speculative_routing=_to_bool(_get_env("SPECULATIVE_ROUTING", "false")),
+        response_pipeline=_get_env("RESPONSE_PIPELINE", "multi"),
+        openai_requests_per_minute=int(_get_env("OPENAI_REQUESTS_PER_MINUTE", "0")),
+        openai_tokens_per_minute=int(_get_env("OPENAI_TOKENS_PER_MINUTE", "0")),
+        context_max_tokens=int(_get_env("CONTEXT_MAX_TOKENS", "3000")),
+        context_keep_turns=int(_get_env("CONTEXT_KEEP_TURNS", "3")),
+        instructions_max_tokens=int(_get_env("INSTRUCTIONS_MAX_TOKENS", "1000")),
+        debounce_min_quiet=float(_get_env("DEBOUNCE_MIN_QUIET", "2")),
+        debounce_max_quiet=float(_get_env("DEBOUNCE_MAX_QUIET", "15")),
+        debounce_max_wait=float(_get_env("DEBOUNCE_MAX_WAIT", "30")),
+        buffer_idle_timeout=float(_get_env("BUFFER_IDLE_TIMEOUT", "3600")),
+        multi_question_extraction=_to_bool(
+            _get_env("MULTI_QUESTION_EXTRACTION", "true")
+        ),
+        database_url=os.getenv("DATABASE_URL") or None,
+        database_pool_min_size=int(_get_env("DATABASE_POOL_MIN_SIZE", "1")),
+        database_pool_max_size=int(_get_env("DATABASE_POOL_MAX_SIZE", "10")),
+        bot_mode=_get_env("BOT_MODE", "polling"),
+        webhook_url=os.getenv("WEBHOOK_URL") or None,
+        webhook_path=_get_env("WEBHOOK_PATH", "/webhook"),
+        webhook_host=_get_env("WEBHOOK_HOST", "0.0.0.0"),
+        webhook_port=int(_get_env("WEBHOOK_PORT", "8080")),
+        webhook_secret=os.getenv("WEBHOOK_SECRET") or None,
+        webhook_workers=int(_get_env("WEBHOOK_WORKERS", "1")),
+        cache_invalidation_interval=float(
+            _get_env("CACHE_INVALIDATION_INTERVAL", "1.0")
+        ),
     )
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator
+import logging
+
+# Tortoise logs every executed statement to this logger at DEBUG level
+DB_CLIENT_LOGGER = "tortoise.db_client"
+
+
+@dataclass
+class QueryCount:
+    value: int = 0
+
+
+_current: ContextVar[QueryCount | None] = ContextVar("db_query_count", default=None)
+
+
+class _QueryCountingHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        count = _current.get()
+        if count is None:
+            return
+        # Connection open/close messages are not queries
+        if isinstance(record.msg, str) and record.msg.endswith(
+            "with params: filename=%s %s"
+        ):
+            return
+        count.value += 1
+
+
+def install() -> None:
+    """
+    Starts counting database queries made inside `counting` blocks.
+    Statements are no longer propagated to the application logs.
+    """
+    logger = logging.getLogger(DB_CLIENT_LOGGER)
+    logger.setLevel(logging.DEBUG)
+    # Otherwise every statement would end up in the bot log
+    logger.propagate = False
+    logger.addHandler(_QueryCountingHandler())
+
+
+@contextmanager
+def counting() -> Iterator[QueryCount]:
+    """
+    Counts database queries made inside the block (and in tasks created from it).
+    Counts stay zero unless `install` was called.
+    """
+    count = QueryCount()
+    token = _current.set(count)
+    try:
+        yield count
+    finally:
+        _current.reset(token)
@@ -0,0 +1,143 @@
+"""
+Minimal local stand-in for the OpenAI chat completions endpoint.
+
+Lets the bot (LLM scheduler, retries, caches) be exercised without spending
+tokens or hitting real rate limits:
+
+    python -m src.utils.fake_openai --port 8080 --latency 0.8 --rpm 60
+
+and point the bot at it with `OPENAI_API_BASE_URL=http://127.0.0.1:8080/v1`.
+Structured outputs are answered with a placeholder object matching the schema.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+from aiohttp import web
+
+
+def _sample(schema: dict, defs: dict) -> object:
+    """Builds the simplest value which satisfies a JSON schema."""
+    if "$ref" in schema:
+        return _sample(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        return _sample(schema["anyOf"][0], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    match schema.get("type"):
+        case "object":
+            return {
+                name: _sample(prop, defs)
+                for name, prop in schema.get("properties", {}).items()
+            }
+        case "array":
+            return []
+        case "boolean":
+            return False
+        case "integer" | "number":
+            return 0
+        case "null":
+            return None
+        case _:
+            return "fake"
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float, jitter: float, rpm: int | None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.rpm = rpm
+        self.requests: collections.deque[float] = collections.deque()
+        self.served = 0
+        self.rejected = 0
+
+    def _rate_limited(self) -> bool:
+        if not self.rpm:
+            return False
+
+        now = time.monotonic()
+        while self.requests and self.requests[0] < now - 60:
+            self.requests.popleft()
+        if len(self.requests) >= self.rpm:
+            return True
+        self.requests.append(now)
+        return False
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        if self._rate_limited():
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+            )
+
+        body = await request.json()
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        content = "ok"
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            content = json.dumps(_sample(schema, schema.get("$defs", {})))
+
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 4
+        completion_tokens = len(content) // 4 + 1
+        self.served += 1
+        return web.json_response(
+            {
+                "id": f"chatcmpl-fake-{self.served}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"served": self.served, "rejected": self.rejected})
+
+
+def build_app(latency: float = 0.5, jitter: float = 0.0, rpm: int | None = None):
+    fake = FakeOpenAI(latency, jitter, rpm)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", fake.chat_completions)
+    app.router.add_get("/stats", fake.stats)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None)
+    args = parser.parse_args()
+
+    web.run_app(
+        build_app(args.latency, args.jitter, args.rpm),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from collections import defaultdict, deque
+import math
+
+
+class Metrics:
+    """
+    In-process counters, gauges and sample windows used to tune the bot.
+    Values live only in memory and are reset on restart.
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        """
+        :param window: how many of the latest samples are kept per observed metric
+        """
+        self._window = window
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._samples: dict[str, deque[float]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Increases a counter.
+
+        :param name: counter name
+        :param value: amount to add
+        """
+        self._counters[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Sets a gauge to the given value.
+
+        :param name: gauge name
+        :param value: current value
+        """
+        self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Records a sample (e.g. a latency in seconds).
+
+        :param name: metric name
+        :param value: observed value
+        """
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self._window)
+        samples.append(value)
+
+    def counter(self, name: str) -> float:
+        """
+        :param name: counter name
+        :return: current counter value (0 if never incremented)
+        """
+        return self._counters.get(name, 0)
+
+    def samples(self, name: str) -> list[float]:
+        """
+        :param name: metric name
+        :return: the latest samples, oldest first
+        """
+        return list(self._samples.get(name, ()))
+
+    def percentile(self, name: str, q: float) -> float | None:
+        """
+        Computes a percentile over the latest samples.
+
+        :param name: metric name
+        :param q: percentile in range [0, 100]
+        :return: the percentile value or None if there are no samples
+        """
+        samples = self._samples.get(name)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        idx = min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)
+        return ordered[max(idx, 0)]
+
+    def report(self) -> str:
+        """
+        :return: human-readable dump of all metrics
+        """
+        lines = []
+        for name in sorted(self._counters):
+            lines.append(f"{name} = {self._counters[name]:g}")
+        for name in sorted(self._gauges):
+            lines.append(f"{name} = {self._gauges[name]:g}")
+        for name in sorted(self._samples):
+            p50 = self.percentile(name, 50)
+            p95 = self.percentile(name, 95)
+            p99 = self.percentile(name, 99)
+            lines.append(
+                f"{name}: n={len(self._samples[name])} "
+                f"p50={p50:.3f} p95={p95:.3f} p99={p99:.3f}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """
+        Drops all collected values.
+        """
+        self._counters.clear()
+        self._gauges.clear()
+        self._samples.clear()
+
+
+metrics = Metrics()
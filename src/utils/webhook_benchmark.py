@@ -0,0 +1,237 @@
+"""
+Update delivery benchmark: webhook against long polling.
+
+Runs a fake Bot API server locally and feeds the same synthetic private
+messages to the dispatcher both ways, measuring the time from an update
+being available to its handler starting:
+
+    python -m src.utils.webhook_benchmark --updates 2000 --rate 500
+    python -m src.utils.webhook_benchmark --mode webhook --handler-delay 0.05
+
+With polling an update is available once the fake server queues it,
+with a webhook once it is posted. Handlers only record the latency
+(and sleep `--handler-delay`), so the bot's own work is not measured.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from src.tg_bot import webhook
+
+TOKEN = "42:fake"
+SECRET_TOKEN = "benchmark-secret"
+
+
+def _update(update_id: int, users: int) -> dict:
+    user_id = 1_000_000 + update_id % users
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": f"message {update_id}",
+        },
+    }
+
+
+class FakeBotApi:
+    """
+    Answers the Bot API methods used by polling, queued updates are
+    returned by `getUpdates` as soon as they arrive.
+    """
+
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+        self._arrived = asyncio.Event()
+
+    def push(self, update: dict) -> None:
+        self.updates.append(update)
+        self._arrived.set()
+
+    async def method(self, request: web.Request) -> web.Response:
+        params = dict(await request.post())
+        match request.match_info["method"].lower():
+            case "getme":
+                result = {"id": 42, "is_bot": True, "first_name": "Bot"}
+            case "getupdates":
+                result = await self._get_updates(
+                    int(params.get("offset", 0)), float(params.get("timeout", 0))
+                )
+            case _:
+                result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except TimeoutError:
+                pass
+        updates, self.updates = self.updates[:100], self.updates[100:]
+        return updates
+
+
+class Recorder:
+    def __init__(self, expected: int, handler_delay: float) -> None:
+        self.expected = expected
+        self.handler_delay = handler_delay
+        self.available_at: dict[int, float] = {}
+        self.latencies: list[float] = []
+        self.done = asyncio.Event()
+
+    def dispatcher(self) -> Dispatcher:
+        dp = Dispatcher()
+
+        @dp.message(F.chat.type == "private")
+        async def handle(message: types.Message) -> None:
+            self.latencies.append(
+                time.perf_counter() - self.available_at[message.message_id]
+            )
+            if len(self.latencies) == self.expected:
+                self.done.set()
+            await asyncio.sleep(self.handler_delay)
+
+        return dp
+
+
+async def _feed(count: int, rate: float, send) -> None:
+    started_at = time.perf_counter()
+    for i in range(1, count + 1):
+        if rate:
+            delay = started_at + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await send(i)
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _polling(args: argparse.Namespace, recorder: Recorder) -> float:
+    api = FakeBotApi()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.method)
+    runner = await _serve(app, args.api_port)
+    bot = Bot(
+        TOKEN,
+        session=AiohttpSession(
+            api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}")
+        ),
+    )
+    dp = recorder.dispatcher()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+    try:
+
+        async def send(i: int) -> None:
+            recorder.available_at[i] = time.perf_counter()
+            api.push(_update(i, args.users))
+
+        started_at = time.perf_counter()
+        await _feed(args.updates, args.rate, send)
+        await recorder.done.wait()
+        return time.perf_counter() - started_at
+    finally:
+        await dp.stop_polling()
+        await polling
+        await runner.cleanup()
+
+
+async def _webhook(args: argparse.Namespace, recorder: Recorder) -> float:
+    bot = Bot(
+        TOKEN,
+        session=AiohttpSession(
+            api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}")
+        ),
+    )
+    app = webhook.build_app(recorder.dispatcher(), bot, SECRET_TOKEN, "/webhook")
+    runner = await _serve(app, args.webhook_port)
+    url = f"http://127.0.0.1:{args.webhook_port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN}
+    # Telegram keeps several connections open to a webhook
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            posts: list[asyncio.Task] = []
+
+            async def post(i: int) -> None:
+                recorder.available_at[i] = time.perf_counter()
+                async with session.post(
+                    url, json=_update(i, args.users), headers=headers
+                ) as response:
+                    response.raise_for_status()
+
+            async def send(i: int) -> None:
+                posts.append(asyncio.create_task(post(i)))
+
+            started_at = time.perf_counter()
+            await _feed(args.updates, args.rate, send)
+            await asyncio.gather(*posts)
+            await recorder.done.wait()
+            return time.perf_counter() - started_at
+    finally:
+        await runner.cleanup()
+
+
+def _report(mode: str, elapsed: float, latencies: list[float]) -> None:
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"mode:          {mode}")
+    print(f"updates:       {len(latencies)}")
+    print(f"throughput:    {len(latencies) / elapsed:.1f} updates/s")
+    print(f"latency p50:   {quantiles[49] * 1000:.1f} ms")
+    print(f"latency p95:   {quantiles[94] * 1000:.1f} ms")
+    print(f"latency max:   {latencies[-1] * 1000:.1f} ms")
+
+
+async def run(args: argparse.Namespace) -> None:
+    modes = {"polling": _polling, "webhook": _webhook}
+    for mode in ("polling", "webhook") if args.mode == "both" else (args.mode,):
+        recorder = Recorder(args.updates, args.handler_delay)
+        elapsed = await asyncio.wait_for(modes[mode](args, recorder), args.timeout)
+        _report(mode, elapsed, recorder.latencies)
+        print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--mode", choices=["polling", "webhook", "both"], default="both"
+    )
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=500,
+        help="updates per second (0 sends all at once)",
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--handler-delay", type=float, default=0.0)
+    parser.add_argument(
+        "--connections", type=int, default=40, help="concurrent webhook requests"
+    )
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
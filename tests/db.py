@@ -0,0 +1,23 @@
+from tortoise import Tortoise
+
+
+async def init() -> None:
+    """
+    Creates the bot's tables in a fresh in-memory SQLite database.
+    """
+    await Tortoise.init(
+        config={
+            "connections": {"default": "sqlite://:memory:"},
+            "apps": {
+                "models": {
+                    "models": ["src.persistence.models"],
+                    "default_connection": "default",
+                },
+            },
+        }
+    )
+    await Tortoise.generate_schemas()
+
+
+async def close() -> None:
+    await Tortoise.close_connections()
@@ -0,0 +1,135 @@
+from dataclasses import replace
+from unittest import mock
+import asyncio
+import time
+import unittest
+
+from src.tg_bot import buffering
+
+POLICY = buffering.DebouncePolicy(
+    min_quiet=0.05,
+    max_quiet=0.2,
+    initial_quiet=0.1,
+    max_wait=0.5,
+    failure_backoff=0.05,
+    max_failure_backoff=0.1,
+    max_failures=3,
+)
+
+
+class DebouncerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 100.0
+        patcher = mock.patch.object(time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.debouncer = buffering.Debouncer(POLICY)
+
+    def test_nothing_buffered(self) -> None:
+        self.assertIsNone(self.debouncer.deadline())
+
+    def test_each_message_resets_the_quiet_window(self) -> None:
+        self.debouncer.message_arrived()
+        self.assertAlmostEqual(self.debouncer.deadline(), 100.1)
+
+        self.now = 100.08
+        self.debouncer.message_arrived()
+        # Twice the gap of 0.08 between the messages
+        self.assertAlmostEqual(self.debouncer.deadline(), 100.08 + 0.16)
+
+    def test_max_wait_caps_the_deadline(self) -> None:
+        self.debouncer.message_arrived()
+        for _ in range(10):
+            self.now += 0.09
+            self.debouncer.message_arrived()
+        self.assertAlmostEqual(self.debouncer.deadline(), 100.5)
+        self.assertTrue(self.debouncer.overdue())
+
+    def test_postpone(self) -> None:
+        self.debouncer.message_arrived()
+        self.debouncer.postpone(1.0)
+        self.assertAlmostEqual(self.debouncer.deadline(), 101.0)
+
+    def test_messages_after_the_answered_ones_start_a_new_batch(self) -> None:
+        self.debouncer.message_arrived()
+        answered_until = self.debouncer.last_message_at
+        self.now = 100.3
+        self.debouncer.message_arrived()
+
+        self.debouncer.batch_done(answered_until=answered_until)
+        self.assertEqual(self.debouncer.first_message_at, 100.3)
+
+        self.debouncer.batch_done()
+        self.assertIsNone(self.debouncer.deadline())
+
+    def test_failure_delay_grows_up_to_the_limit(self) -> None:
+        delays = [POLICY.failure_delay(failures) for failures in range(1, 5)]
+        self.assertEqual(delays, [0.05, 0.1, 0.1, 0.1])
+
+
+class FlushSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        buffering.configure(POLICY)
+        self.addCleanup(buffering.configure, buffering.DebouncePolicy())
+        self.flushes: list[float] = []
+        self.failures_left = 0
+        self.evicted: list[int] = []
+        self.scheduler = buffering.FlushScheduler(self._flush, self.evicted.append)
+
+    async def asyncTearDown(self) -> None:
+        await self.scheduler.close()
+
+    async def _flush(self, user_id: int) -> None:
+        self.flushes.append(time.monotonic())
+        if self.failures_left:
+            self.failures_left -= 1
+            raise RuntimeError("database is down")
+        self.scheduler.debouncer(user_id).batch_done()
+
+    async def test_messages_in_quick_succession_are_flushed_once(self) -> None:
+        for _ in range(3):
+            self.scheduler.message_arrived(1)
+            await asyncio.sleep(0.03)
+        self.assertEqual(self.flushes, [])
+
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(self.flushes), 1)
+
+    async def test_idle_users_are_dropped(self) -> None:
+        buffering.configure(replace(POLICY, idle_timeout=0.3))
+        self.scheduler.message_arrived(1)
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(self.flushes), 1)
+        self.assertIn(1, self.scheduler.debouncers)
+
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.evicted, [1])
+        self.assertNotIn(1, self.scheduler.debouncers)
+
+    async def test_failed_flushes_back_off_and_drop_the_user(self) -> None:
+        self.failures_left = 10
+        with self.assertLogs(buffering.logger, "ERROR"):
+            self.scheduler.message_arrived(1)
+            await asyncio.sleep(0.6)
+
+        self.assertEqual(len(self.flushes), POLICY.max_failures)
+        gaps = [b - a for a, b in zip(self.flushes, self.flushes[1:])]
+        self.assertGreaterEqual(gaps[0], 0.05)
+        self.assertGreaterEqual(gaps[1], 0.1)
+        self.assertEqual(self.evicted, [1])
+        self.assertNotIn(1, self.scheduler.debouncers)
+
+    async def test_successful_flush_resets_the_failures(self) -> None:
+        for _ in range(2):
+            self.failures_left = POLICY.max_failures - 1
+            with self.assertLogs(buffering.logger, "ERROR"):
+                self.scheduler.message_arrived(1)
+                await asyncio.sleep(0.5)
+            self.assertEqual(self.failures_left, 0)
+
+        self.assertEqual(len(self.flushes), 2 * POLICY.max_failures)
+        self.assertEqual(self.evicted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
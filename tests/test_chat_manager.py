@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+
+from tortoise.transactions import in_transaction
+
+from src import chat, persistence, types
+from src.chat.generate_response import ResponseToUser
+from src.persistence import models
+from tests import db
+
+QUESTIONS = [
+    types.Question("What is your name?", "Any name"),
+    types.Question("How old are you?", "A number"),
+]
+
+
+class ChatManagerReplyTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await db.init()
+        await models.User.create(id=1, name="user", url="tg://user?id=1")
+        self.store = persistence.TortoiseMessageBuffer()
+        self.agent_called = asyncio.Event()
+        self.agent_done = asyncio.Event()
+        self.agent_done.set()
+        self.chat_manager = chat.ChatManager(
+            question_list=chat.CachedQuestionList(
+                persistence.TortoiseQuestionList(QUESTIONS)
+            ),
+            user_answer_storage=chat.CachedUserAnswerStorage(
+                persistence.TortoiseUserAnswerStorage()
+            ),
+            context=persistence.TortoiseContext(),
+            generate_response=self._respond,
+            generate_reply=None,
+            extract_answers=self._extract_answers,
+            transaction=in_transaction,
+        )
+
+    async def asyncTearDown(self) -> None:
+        await db.close()
+
+    async def _respond(self, user_input: str, **kwargs) -> ResponseToUser:
+        self.agent_called.set()
+        await self.agent_done.wait()
+        return ResponseToUser(
+            user_input=user_input,
+            response_text="Nice to meet you",
+            extracted_data=user_input,
+            ready_for_next_question=True,
+        )
+
+    async def _extract_answers(
+        self,
+        context: str | None,
+        questions: list[types.Question],
+        instructions: str | None,
+    ) -> list[str | None]:
+        return [None] * len(questions)
+
+    async def _buffer(self, text: str) -> types.PendingMessage:
+        await self.store.push(1, 1, 1, text)
+        return (await self.store.pending(1))[-1]
+
+    async def _assert_nothing_stored(self) -> None:
+        self.assertEqual(await models.QAEntry.all().count(), 0)
+        self.assertEqual(await models.PartialAnswerSegment.all().count(), 0)
+        self.assertEqual(await self.chat_manager.current_question(1), QUESTIONS[0].text)
+        self.assertEqual(len(await self.store.pending(1)), 1)
+
+    async def test_input_is_consumed_with_the_turn(self) -> None:
+        message = await self._buffer("John")
+
+        async def consume_input() -> None:
+            await self.store.remove(1, message.id)
+
+        reply = await self.chat_manager.reply(1, "John", consume_input)
+        self.assertEqual(reply, QUESTIONS[1].text)
+        self.assertEqual(await self.store.pending(1), [])
+        self.assertEqual(
+            await models.QAEntry.filter(user_id=1).values_list("answer", flat=True),
+            ["John"],
+        )
+
+    async def test_failure_while_consuming_rolls_back_the_turn(self) -> None:
+        message = await self._buffer("John")
+
+        async def consume_input() -> None:
+            await self.store.remove(1, message.id)
+            raise RuntimeError("database is down")
+
+        with self.assertRaises(RuntimeError):
+            await self.chat_manager.reply(1, "John", consume_input)
+        # Neither the turn nor the removal is committed, cached progress included
+        await self._assert_nothing_stored()
+
+    async def test_reply_is_cancellable_until_the_turn_is_stored(self) -> None:
+        await self._buffer("John")
+        consumed = []
+
+        async def consume_input() -> None:
+            consumed.append(True)
+
+        self.agent_done.clear()
+        reply = asyncio.create_task(self.chat_manager.reply(1, "John", consume_input))
+        await self.agent_called.wait()
+        self.assertTrue(self.chat_manager.reply_cancellable(1))
+
+        reply.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reply
+        self.assertEqual(consumed, [])
+        self.assertTrue(self.chat_manager.reply_cancellable(1))
+        await self._assert_nothing_stored()
+
+    async def test_reply_is_not_cancellable_while_storing(self) -> None:
+        storing = asyncio.Event()
+        stored = asyncio.Event()
+
+        async def consume_input() -> None:
+            storing.set()
+            await stored.wait()
+
+        reply = asyncio.create_task(self.chat_manager.reply(1, "John", consume_input))
+        await storing.wait()
+        self.assertFalse(self.chat_manager.reply_cancellable(1))
+
+        stored.set()
+        self.assertEqual(await reply, QUESTIONS[1].text)
+        self.assertTrue(self.chat_manager.reply_cancellable(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import unittest
+
+from src import chat, persistence
+from src.chat.context_budget import SUMMARY_TEMPLATE, ContextBudget, ContextCompactor
+from src.chat.in_memory import InMemoryUserAnswerStorage
+from src.persistence import models
+from tests import db
+
+SUMMARY = SUMMARY_TEMPLATE.format(summary="summary")
+
+
+class ContextCompactorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.storage = InMemoryUserAnswerStorage()
+        self.summarized: list[str] = []
+
+    async def _summarize(self, text: str) -> str:
+        self.summarized.append(text)
+        return "summary"
+
+    def _compactor(self, keep_turns: int) -> ContextCompactor:
+        return ContextCompactor(
+            self.storage,
+            self._summarize,
+            ContextBudget(max_tokens=1, keep_turns=keep_turns),
+        )
+
+    async def _compact(self, compactor: ContextCompactor) -> None:
+        compactor.maybe_compact(1, await self.storage.get(1))
+        await asyncio.gather(*compactor._tasks.values())
+
+    async def test_latest_turns_are_kept(self) -> None:
+        for i in range(4):
+            await self.storage.append(1, f"turn {i}")
+
+        await self._compact(self._compactor(keep_turns=2))
+        self.assertEqual(self.summarized, ["turn 0turn 1"])
+        self.assertEqual(
+            [text for _, text in await self.storage.segments(1)],
+            [SUMMARY, "turn 2", "turn 3"],
+        )
+
+    async def test_everything_is_summarized_without_kept_turns(self) -> None:
+        for i in range(2):
+            await self.storage.append(1, f"turn {i}")
+
+        await self._compact(self._compactor(keep_turns=0))
+        self.assertEqual(self.summarized, ["turn 0turn 1"])
+        self.assertEqual(
+            [text for _, text in await self.storage.segments(1)],
+            [SUMMARY],
+        )
+
+    async def test_nothing_to_summarize(self) -> None:
+        await self.storage.append(1, "turn 0")
+
+        await self._compact(self._compactor(keep_turns=3))
+        self.assertEqual(self.summarized, [])
+        self.assertEqual(await self.storage.get(1), "turn 0")
+
+
+class ConcurrentCompactionTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Turns stored while the summary is being written, on the storages the bot uses.
+    """
+
+    async def asyncSetUp(self) -> None:
+        await db.init()
+        await models.User.create(id=1, name="user", url="tg://user?id=1")
+        self.storage = chat.CachedUserAnswerStorage(
+            persistence.TortoiseUserAnswerStorage()
+        )
+        self.summarizing = asyncio.Event()
+        self.summarized = asyncio.Event()
+        self.compactor = ContextCompactor(
+            self.storage, self._summarize, ContextBudget(max_tokens=1, keep_turns=1)
+        )
+        for i in range(3):
+            await self.storage.append(1, f"turn {i}")
+
+    async def asyncTearDown(self) -> None:
+        await db.close()
+
+    async def _summarize(self, text: str) -> str:
+        self.summarizing.set()
+        await self.summarized.wait()
+        return "summary"
+
+    async def _texts(self) -> list[str]:
+        return [text for _, text in await self.storage.segments(1)]
+
+    async def test_turns_appended_meanwhile_are_kept(self) -> None:
+        self.compactor.maybe_compact(1, await self.storage.get(1))
+        await self.summarizing.wait()
+        await self.storage.append(1, "turn 3")
+        await self.storage.append(1, "turn 4")
+
+        self.summarized.set()
+        await asyncio.gather(*self.compactor._tasks.values())
+        self.assertEqual(await self._texts(), [SUMMARY, "turn 2", "turn 3", "turn 4"])
+        # The cached context is not stale
+        self.assertEqual(
+            await self.storage.get(1),
+            await persistence.TortoiseUserAnswerStorage().get(1),
+        )
+
+    async def test_summary_of_a_replaced_context_is_discarded(self) -> None:
+        self.compactor.maybe_compact(1, await self.storage.get(1))
+        await self.summarizing.wait()
+        await self.storage.replace(1, "new question")
+        await self.storage.append(1, "turn 0")
+
+        self.summarized.set()
+        await asyncio.gather(*self.compactor._tasks.values())
+        self.assertEqual(await self._texts(), ["new question", "turn 0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
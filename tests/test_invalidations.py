@@ -0,0 +1,77 @@
+import datetime
+import unittest
+
+from tortoise import timezone
+
+from src.persistence import invalidations, models
+from tests import db
+
+
+class InvalidationBusTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await db.init()
+        # Two worker processes sharing the database
+        self.first = invalidations.InvalidationBus(origin="first", poll_interval=60)
+        self.second = invalidations.InvalidationBus(origin="second", poll_interval=60)
+        self.received: list[tuple[str, int | None]] = []
+        for cache in (invalidations.INSTRUCTIONS, invalidations.CHAT_STATE):
+            self.first.subscribe(
+                cache,
+                lambda user_id, cache=cache: self.received.append((cache, user_id)),
+            )
+
+    async def asyncTearDown(self) -> None:
+        await self.first.close()
+        await self.second.close()
+        await db.close()
+
+    async def test_changes_of_other_processes_are_received(self) -> None:
+        await self.first.start()
+        await self.second.start()
+
+        await self.second.publish(invalidations.CHAT_STATE, 1)
+        await self.second.publish(invalidations.INSTRUCTIONS)
+        await self.first.publish(invalidations.CHAT_STATE, 2)
+        await self.first.poll()
+
+        self.assertEqual(
+            self.received,
+            [(invalidations.CHAT_STATE, 1), (invalidations.INSTRUCTIONS, None)],
+        )
+
+        # Every change is received once
+        await self.first.poll()
+        self.assertEqual(len(self.received), 2)
+
+    async def test_changes_before_start_are_skipped(self) -> None:
+        await self.second.start()
+        await self.second.publish(invalidations.CHAT_STATE, 1)
+
+        await self.first.start()
+        await self.first.poll()
+
+        self.assertEqual(self.received, [])
+
+    async def test_nothing_is_published_until_started(self) -> None:
+        await self.second.publish(invalidations.CHAT_STATE, 1)
+
+        self.assertEqual(await models.CacheInvalidation.all().count(), 0)
+
+    async def test_old_changes_are_pruned(self) -> None:
+        await self.second.start()
+        await self.second.publish(invalidations.CHAT_STATE, 1)
+        await self.second.publish(invalidations.CHAT_STATE, 2)
+        await models.CacheInvalidation.filter(user_id=1).update(
+            created_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+
+        await self.second._prune()
+
+        self.assertEqual(
+            await models.CacheInvalidation.all().values_list("user_id", flat=True),
+            [2],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import unittest
+
+from src.chat.usage import UsageRecord
+from src.persistence import models
+from src.persistence import ledger
+from src.persistence.ledger import LedgerWriter
+from tests import db
+
+
+def _record(agent: str, **kwargs) -> UsageRecord:
+    return UsageRecord(
+        agent=agent,
+        model="gpt-4.1-mini",
+        prompt_tokens=100,
+        completion_tokens=10,
+        latency=0.5,
+        **kwargs,
+    )
+
+
+class LedgerWriterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await db.init()
+
+    async def asyncTearDown(self) -> None:
+        await db.close()
+
+    async def test_close_writes_the_batch_being_collected(self) -> None:
+        ledger = LedgerWriter(batch_size=100, flush_interval=60)
+        ledger.start()
+        for i in range(3):
+            ledger.submit(_record(f"agent {i}"))
+
+        await ledger.close()
+        self.assertEqual(
+            await models.LlmCall.all().order_by("id").values_list("agent", flat=True),
+            ["agent 0", "agent 1", "agent 2"],
+        )
+
+    async def test_close_writes_records_submitted_after_stopping(self) -> None:
+        ledger = LedgerWriter(batch_size=2, flush_interval=60)
+        for i in range(5):
+            ledger.submit(_record(f"agent {i}"))
+
+        await ledger.close()
+        self.assertEqual(await models.LlmCall.all().count(), 5)
+
+    async def test_full_batches_are_written_without_waiting(self) -> None:
+        ledger = LedgerWriter(batch_size=2, flush_interval=60)
+        ledger.start()
+        for i in range(2):
+            ledger.submit(_record(f"agent {i}"))
+        for _ in range(10):
+            if await models.LlmCall.all().count() == 2:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(await models.LlmCall.all().count(), 2)
+        await ledger.close()
+
+    async def test_usage_by_day(self) -> None:
+        def at(day: int, hour: int) -> datetime.datetime:
+            return datetime.datetime(2025, 1, day, hour, tzinfo=datetime.UTC)
+
+        writer = LedgerWriter()
+        for created_at in (at(1, 0), at(1, 23), at(2, 12), at(3, 12)):
+            writer.submit(_record("router", created_at=created_at))
+        await writer.close()
+
+        rows = await ledger.usage_by_day(at(1, 12))
+        self.assertEqual(
+            [(row["day"], row["calls"], row["prompt_tokens_sum"]) for row in rows],
+            [
+                (datetime.date(2025, 1, 1), 1, 100),
+                (datetime.date(2025, 1, 2), 1, 100),
+                (datetime.date(2025, 1, 3), 1, 100),
+            ],
+        )
+        self.assertEqual(rows[0]["completion_tokens_sum"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from src import persistence
+from tests import db
+
+
+class TortoiseMessageBufferTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await db.init()
+        self.store = persistence.TortoiseMessageBuffer()
+
+    async def asyncTearDown(self) -> None:
+        await db.close()
+
+    async def test_remove_keeps_later_messages(self) -> None:
+        for i in range(3):
+            await self.store.push(1, 10, i, f"message {i}")
+        await self.store.push(2, 20, 0, "other user")
+        pending = await self.store.pending(1)
+        self.assertEqual([m.text for m in pending], [f"message {i}" for i in range(3)])
+
+        await self.store.remove(1, pending[1].id)
+        self.assertEqual([m.text for m in await self.store.pending(1)], ["message 2"])
+        # Removing again changes nothing
+        await self.store.remove(1, pending[1].id)
+        self.assertEqual(len(await self.store.pending(1)), 1)
+        self.assertCountEqual(await self.store.users_with_pending(), [1, 2])
+
+    async def test_lease_is_exclusive(self) -> None:
+        self.assertEqual(await self.store.acquire(1, "a", 60), (True, None))
+        self.assertEqual(await self.store.acquire(1, "b", 60), (False, "a"))
+        # The owner may extend it
+        self.assertEqual(await self.store.acquire(1, "a", 60), (True, "a"))
+        # Leases of other users are independent
+        self.assertEqual(await self.store.acquire(2, "b", 60), (True, None))
+
+    async def test_released_lease_is_taken_over(self) -> None:
+        await self.store.acquire(1, "a", 60)
+        await self.store.release(1, "b")
+        self.assertEqual(await self.store.acquire(1, "b", 60), (False, "a"))
+
+        await self.store.release(1, "a")
+        self.assertEqual(await self.store.acquire(1, "b", 60), (True, "a"))
+        self.assertEqual(await self.store.acquire(1, "a", 60), (False, "b"))
+
+    async def test_expired_lease_is_taken_over(self) -> None:
+        await self.store.acquire(1, "a", 0.05)
+        self.assertEqual(await self.store.acquire(1, "b", 60), (False, "a"))
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(await self.store.acquire(1, "b", 60), (True, "a"))
+
+    async def test_concurrent_takeover_has_one_winner(self) -> None:
+        await self.store.acquire(1, "a", 0)
+        results = await asyncio.gather(
+            *(self.store.acquire(1, owner, 60) for owner in ("b", "c", "d"))
+        )
+        self.assertEqual(sum(taken for taken, _ in results), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+from src.chat.response_cache import SqliteCache
+
+
+class SqliteCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(pathlib.Path(directory.name) / "cache.sqlite3")
+
+    def _keys(self) -> list[str]:
+        with sqlite3.connect(self.path) as db:
+            return [row[0] for row in db.execute("SELECT key FROM response_cache")]
+
+    async def test_expired_responses_are_not_returned(self) -> None:
+        cache = SqliteCache(self.path, ttl=0.05)
+        await cache.set("key", "value")
+        self.assertEqual(await cache.get("key"), "value")
+
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await cache.get("key"))
+        await cache.close()
+
+    async def test_expired_rows_are_deleted_on_open(self) -> None:
+        cache = SqliteCache(self.path, ttl=0.05)
+        await cache.set("old", "value")
+        await cache.close()
+        await asyncio.sleep(0.1)
+
+        cache = SqliteCache(self.path, ttl=0.05)
+        await cache.set("new", "value")
+        self.assertEqual(self._keys(), ["new"])
+        await cache.close()
+
+    async def test_expired_rows_are_deleted_while_writing(self) -> None:
+        cache = SqliteCache(self.path, ttl=0.05, prune_every=3)
+        await cache.set("old 1", "value")
+        await cache.set("old 2", "value")
+        await asyncio.sleep(0.1)
+
+        await cache.set("new", "value")
+        self.assertEqual(self._keys(), ["new"])
+        await cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
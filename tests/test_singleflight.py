@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from src.chat.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.cancelled = 0
+
+    async def _work(self) -> int:
+        self.calls += 1
+        call = self.calls
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return call
+
+    async def test_concurrent_calls_share_the_result(self) -> None:
+        callers = [
+            asyncio.create_task(self.flight.do("key", self._work)) for _ in range(3)
+        ]
+        await self.started.wait()
+        self.assertTrue(self.flight.in_flight("key"))
+        self.release.set()
+
+        self.assertEqual(await asyncio.gather(*callers), [1, 1, 1])
+        self.assertEqual(self.calls, 1)
+        self.assertFalse(self.flight.in_flight("key"))
+
+    async def test_work_survives_while_a_caller_waits(self) -> None:
+        first = asyncio.create_task(self.flight.do("key", self._work))
+        second = asyncio.create_task(self.flight.do("key", self._work))
+        await self.started.wait()
+
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.release.set()
+        self.assertEqual(await second, 1)
+        self.assertEqual(self.cancelled, 0)
+
+    async def test_last_caller_leaving_cancels_the_work(self) -> None:
+        caller = asyncio.create_task(self.flight.do("key", self._work))
+        await self.started.wait()
+
+        caller.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await caller
+        self.assertFalse(self.flight.in_flight("key"))
+        await asyncio.sleep(0)
+        self.assertEqual(self.cancelled, 1)
+
+    async def test_call_after_cancellation_starts_a_fresh_flight(self) -> None:
+        caller = asyncio.create_task(self.flight.do("key", self._work))
+        await self.started.wait()
+        caller.cancel()
+        # Rejoins before the cancelled work has had a chance to finish
+        rejoined = asyncio.create_task(self.flight.do("key", self._work))
+        with self.assertRaises(asyncio.CancelledError):
+            await caller
+
+        self.release.set()
+        self.assertEqual(await rejoined, 2)
+        self.assertEqual(self.cancelled, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+import asyncio
+import unittest
+
+from aiogram import exceptions
+
+from src.persistence import models
+from src.tg_bot import topics
+from tests import db
+
+DELETED_THREAD_ID = 10
+
+
+class FakeBot:
+    """
+    Answers like Telegram after the forum topic of the user was deleted.
+    """
+
+    def __init__(self) -> None:
+        self.created: list[int] = []
+        self.sent: list[int] = []
+        self.error: str | None = None
+
+    async def create_forum_topic(self, chat_id: int, name: str) -> SimpleNamespace:
+        await asyncio.sleep(0.01)
+        self.created.append(100 + len(self.created))
+        return SimpleNamespace(message_thread_id=self.created[-1])
+
+    async def send_message(self, chat_id: int, message_thread_id: int, text: str):
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise exceptions.TelegramBadRequest(method=None, message=self.error)
+        if message_thread_id == DELETED_THREAD_ID:
+            raise exceptions.TelegramBadRequest(
+                method=None, message="Bad Request: message thread not found"
+            )
+        self.sent.append(message_thread_id)
+        return text
+
+
+class TopicMirrorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await db.init()
+        user = await models.User.create(id=1, name="user", url="tg://user?id=1")
+        await models.TopicGroup.create(user=user, topic_group_id=DELETED_THREAD_ID)
+        self.bot = FakeBot()
+        self.topic = topics.Topic(
+            user_id=1, supergroup_id=-100, thread_id=DELETED_THREAD_ID, name="user"
+        )
+
+    async def asyncTearDown(self) -> None:
+        await db.close()
+
+    async def test_deleted_topic_is_recreated_once(self) -> None:
+        # Each message has its own mirror, they share the topic
+        mirrors = [topics.TopicMirror(self.bot, self.topic) for _ in range(3)]
+        with self.assertLogs(topics.logger, "WARNING"):
+            results = await asyncio.gather(
+                *(
+                    mirror.send_message(f"message {i}")
+                    for i, mirror in enumerate(mirrors)
+                )
+            )
+
+        self.assertEqual(results, ["message 0", "message 1", "message 2"])
+        self.assertEqual(self.bot.created, [100])
+        self.assertEqual(self.bot.sent, [100, 100, 100])
+        self.assertEqual(self.topic.thread_id, 100)
+        self.assertEqual(
+            await models.TopicGroup.filter(user_id=1).values_list(
+                "topic_group_id", flat=True
+            ),
+            [100],
+        )
+
+    async def test_topic_recreated_by_other_worker_is_adopted(self) -> None:
+        await models.TopicGroup.filter(user_id=1).update(topic_group_id=42)
+
+        await topics.TopicMirror(self.bot, self.topic).send_message("message")
+
+        self.assertEqual(self.bot.created, [])
+        self.assertEqual(self.bot.sent, [42])
+        self.assertEqual(self.topic.thread_id, 42)
+
+    async def test_other_errors_are_raised(self) -> None:
+        self.bot.error = "Bad Request: message is too long"
+        with self.assertRaises(exceptions.TelegramBadRequest):
+            await topics.TopicMirror(self.bot, self.topic).send_message("message")
+        self.assertEqual(self.bot.created, [])
+
+
+if __name__ == "__main__":
+    unittest.main()